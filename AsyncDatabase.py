@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Query:
+    """
+    A read running on a worker thread, that can be interrupted while SQLite executes it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # connections of the worker thread, the read can run on either of them
+        self.connections = []
+        self.finished = False
+
+    def interrupt(self):
+        # the lock keeps the worker from starting another query on the same connections meanwhile
+        with self.lock:
+            if not self.finished:
+                for connection in self.connections:
+                    connection.interrupt()
+
+
+class AsyncDatabase:
+    """
+    Asyncio counterpart of a Database, so that an event loop never waits for the disk.
+
+    Every method of the Database is available as a coroutine with the same name and arguments, e.g.
+    await adb.get_recipe_by_id(1) or await adb.add_to_meal_history(...), and runs on a bounded pool of worker
+    threads, each with its own connections (see ConnectionPool). Every call accepts a timeout keyword, that defaults
+    to the timeout of the AsyncDatabase (None waits forever).
+
+    Reads (the get_ methods) are coalesced: identical reads awaited at the same time run a single query, whose result
+    is shared by all the callers and must not be modified. A cancelled or timed out read stops waiting immediately;
+    the query is interrupted when no caller is waiting for it anymore. Writes are never interrupted once started,
+    since that could leave half of their changes applied: cancelling one only drops it if it did not start yet.
+
+    Groups of calls that must run in the same transaction go through run(), e.g.
+    await adb.run(lambda db: [db.add_recipe(...) for ...]) inside a db.batch().
+    """
+
+    def __init__(self, db, max_workers=4, timeout=None):
+        self.db = db
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='AsyncDatabase')
+        # reads in progress: (method name, arguments) -> [task, number of callers waiting for it]
+        self.pending = {}
+
+    def __getattr__(self, name):
+        method = getattr(self.db, name)
+        if name in ['batch', 'close'] or name.startswith('iter_') or not callable(method):
+            raise AttributeError(f"{name} is not available on AsyncDatabase, use run() to call it on a worker thread")
+        if name.startswith('get_'):
+            return functools.partial(self.read, name)
+        return functools.partial(self.call, name)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    def _timeout(self, timeout):
+        return self.timeout if timeout is None else timeout
+
+    def _read_on_worker(self, query, function, args):
+        with query.lock:
+            # the connections of an in-memory database are shared by all the threads, interrupting them could stop
+            # the queries of other callers. Some reads, e.g. the point lookups, run on the read-write connection.
+            if self.db.pool.shared is None:
+                query.connections = [self.db.pool.writer(), self.db.pool.reader()]
+        try:
+            return function(*args)
+        finally:
+            with query.lock:
+                query.finished = True
+
+    async def _execute(self, function, args, kwargs=None, interruptible=False):
+        loop = asyncio.get_running_loop()
+        query = _Query()
+        if interruptible:
+            work = functools.partial(self._read_on_worker, query, function, args)
+        else:
+            work = functools.partial(function, *args, **(kwargs or {}))
+        try:
+            # a call cancelled before a worker picks it up never runs
+            return await loop.run_in_executor(self.executor, work)
+        except asyncio.CancelledError:
+            query.interrupt()
+            raise
+
+    async def read(self, name, *args, timeout=None):
+        """
+        Runs a read method of the Database, sharing the query with the identical reads already in progress.
+
+        Parameters:
+        name (str): name of the Database method.
+        args: its positional arguments.
+        timeout (float): seconds after which asyncio.TimeoutError is raised, None for the default timeout.
+        """
+        key = (name, args)
+        try:
+            hash(key)
+        except TypeError:
+            # unhashable arguments, e.g. lists, cannot be matched with other reads
+            return await asyncio.wait_for(self._execute(getattr(self.db, name), args, interruptible=True),
+                                          self._timeout(timeout))
+
+        entry = self.pending.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(self._execute(getattr(self.db, name), args, interruptible=True))
+            entry = [task, 0]
+            self.pending[key] = entry
+            task.add_done_callback(lambda _: self.pending.pop(key) if self.pending.get(key) is entry else None)
+
+        entry[1] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry[0]), self._timeout(timeout))
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # nobody waits for the query anymore
+                if self.pending.get(key) is entry:
+                    del self.pending[key]
+                entry[0].cancel()
+
+    async def call(self, name, *args, timeout=None, **kwargs):
+        """
+        Runs any method of the Database on a worker thread, without sharing it with other calls.
+
+        Parameters:
+        name (str): name of the Database method.
+        args, kwargs: its arguments.
+        timeout (float): seconds after which asyncio.TimeoutError is raised, None for the default timeout.
+        """
+        return await asyncio.wait_for(self._execute(getattr(self.db, name), args, kwargs), self._timeout(timeout))
+
+    async def run(self, function, *args, timeout=None):
+        """
+        Runs function(db, *args) on a worker thread, e.g. to make several changes in a single db.batch().
+        """
+        return await asyncio.wait_for(self._execute(function, (self.db,) + args), self._timeout(timeout))
+
+    async def close(self):
+        """
+        Waits for the calls in progress, stops the worker threads and closes the database.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+        self.db.close()
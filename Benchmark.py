@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from CandidateRanking import CandidateRanking
+from Database import Database
+from DietaryFilter import DietaryFilter
+from MealPlannerInterface import create_dataset, fit_model, create_predicion_list
+from PantryCoverage import PantryCoverage
+from Profiling import StageProfiler, set_profiler
+from RecipeCatalog import RecipeCatalog
+from SyntheticData import generate_database, generate_rows, write_csv
+from WeeklyPlanSolver import WeeklyPlanSolver
+
+# Size tiers of the synthetic databases, the counts are passed to SyntheticData.generate_rows
+TIERS = {
+    'small': {'ingredients': 100, 'recipes': 500, 'ingredients_per_recipe': 8, 'profiles': 4,
+              'intolerances_per_profile': 2, 'history': 240},
+    'medium': {'ingredients': 500, 'recipes': 5000, 'ingredients_per_recipe': 10, 'profiles': 10,
+               'intolerances_per_profile': 3, 'history': 5000},
+    'large': {'ingredients': 2000, 'recipes': 50000, 'ingredients_per_recipe': 12, 'profiles': 50,
+              'intolerances_per_profile': 5, 'history': 100000},
+}
+
+# Stages slower than this ratio with respect to the baseline are reported as regressions
+REGRESSION_THRESHOLD = 1.2
+
+# Modules imported by the command line and by the worker processes for the CRUD operations: they must be imported
+# within the budget and must not load the heavy dependencies, which are only needed to train, score or import CSV
+STARTUP_MODULES = ['Database', 'MealPlannerInterface', 'ShardManager']
+STARTUP_BUDGET_SECONDS = 1.0
+HEAVY_MODULES = ['sklearn', 'pandas', 'scipy']
+
+
+def measure(function, *args, **kwargs):
+    """
+    Runs a function measuring its wall time and the peak of the memory allocated by Python while it runs.
+
+    Returns:
+    tuple: (result of the function, dict with seconds and peak_memory_bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {'seconds': seconds, 'peak_memory_bytes': peak}
+
+
+def select_meal(db, predictions, catalog, participants):
+    """
+    Non-interactive version of Meals_plan_creator.single_meal: the first suggested main dish and side are accepted.
+    """
+    allowed = DietaryFilter(db, catalog).filter(predictions, participants)
+    allowed = PantryCoverage(db, catalog).rank(allowed)
+    ranking = CandidateRanking(allowed, catalog)
+    return next(ranking.main_dishes(), None), next(ranking.sides(), None)
+
+
+def run_tier(name, counts, directory, seed=0, profiler=None):
+    """
+    Generates the database of a tier and times every stage of the planner pipeline on it.
+
+    Parameters:
+    profiler (StageProfiler): if given, it also receives the stages of the pipeline, with their query counts.
+
+    Returns:
+    dict: stage name -> measures.
+    """
+    results = {}
+    db_file = os.path.join(directory, f"{name}.db")
+    db, results['generate'] = measure(generate_database, db_file, seed=seed, **counts)
+    if profiler is not None:
+        profiler.attach(db)
+
+    dataset, results['create_dataset'] = measure(create_dataset, db, include_archive=True)
+    model, results['train'] = measure(fit_model, dataset)
+    predictions, results['create_predicion_list'] = measure(create_predicion_list, db, model)
+
+    catalog, results['load_catalog'] = measure(RecipeCatalog, db)
+    participants = [profile['name'] for profile in db.get_all_profiles()][:2]
+    _, results['select_meal'] = measure(select_meal, db, predictions, catalog, participants)
+    _, results['solve_weekly_plan'] = measure(WeeklyPlanSolver(db, predictions, catalog, time_budget=0).solve)
+    _, results['get_weekly_meal_plan'] = measure(db.get_weekly_meal_plan)
+
+    # Coverage of the whole catalog by a storage holding half of the ingredients, then after one storage row changes
+    ingredients = [ingredient.name for ingredient in db.get_all_ingredients()]
+    db.add_to_storage_many([(name, 100) for name in ingredients[::2]])
+    pantry = PantryCoverage(db, catalog)
+    _, results['pantry_coverage'] = measure(pantry.coverage)
+    if ingredients:
+        db.modify_storage_quantity(ingredients[0], 1000)
+    _, results['pantry_coverage_update'] = measure(pantry.coverage)
+
+    # CSV import of the whole catalog in an empty database
+    rows = generate_rows(seed=seed, **counts)
+    import_db = Database(os.path.join(directory, f"{name}_import.db"))
+    for table in ['ingredients', 'recipes', 'recipe_ingredients']:
+        csv_file = os.path.join(directory, f"{name}_{table}.csv")
+        write_csv(csv_file, table, rows[table])
+        _, results[f"import_{table}_csv"] = measure(import_db.load_data_from_csv, csv_file, table)
+
+    db.close()
+    import_db.close()
+    return results
+
+
+def measure_startup(module, repeats=3):
+    """
+    Imports a module in a new interpreter, as a command line invocation or a new worker process does.
+
+    Returns:
+    dict: seconds, the fastest of the repeats, and the heavy modules that the import loaded.
+    """
+    code = (f"import sys, time\n"
+            f"start = time.perf_counter()\n"
+            f"import {module}\n"
+            f"print(time.perf_counter() - start)\n"
+            f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    times = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.splitlines()
+        times.append(float(output[0]))
+    heavy = output[1].split(',') if len(output) > 1 and output[1] else []
+    return {'seconds': min(times), 'heavy_modules': heavy}
+
+
+def check_startup(startup):
+    """
+    Returns:
+    list: a message for every module imported over the budget or loading heavy modules.
+    """
+    problems = []
+    for module, measures in startup.items():
+        if measures['seconds'] > STARTUP_BUDGET_SECONDS:
+            problems.append(f"importing {module} takes {measures['seconds']:.2f} s, over the budget of "
+                            f"{STARTUP_BUDGET_SECONDS:.2f} s")
+        if measures['heavy_modules']:
+            problems.append(f"importing {module} loads {', '.join(measures['heavy_modules'])}")
+    return problems
+
+
+def compare(results, baseline):
+    """
+    Compares the results with the ones of a previous run.
+
+    Returns:
+    list: (tier, stage, ratio) of every stage slower than REGRESSION_THRESHOLD times the baseline.
+    """
+    regressions = []
+    for tier, stages in results['tiers'].items():
+        for stage, measures in stages.items():
+            previous = baseline.get('tiers', {}).get(tier, {}).get(stage)
+            if previous is None or previous['seconds'] <= 0:
+                continue
+            ratio = measures['seconds'] / previous['seconds']
+            if ratio > REGRESSION_THRESHOLD:
+                regressions.append((tier, stage, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the meal planner pipeline on synthetic databases.")
+    parser.add_argument('--tiers', nargs='+', default=['small', 'medium'], choices=list(TIERS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file where the results are saved")
+    parser.add_argument('--baseline', help="JSON file of a previous run to compare with")
+    parser.add_argument('--profile', action='store_true',
+                        help="also record the pipeline stages with a StageProfiler, counting the SQL queries")
+    parser.add_argument('--startup-only', action='store_true',
+                        help="only check the import time of the command line modules")
+    args = parser.parse_args()
+
+    results = {'date': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+               'seed': args.seed, 'tiers': {}, 'startup': {}}
+
+    for module in STARTUP_MODULES:
+        results['startup'][module] = measure_startup(module)
+        print(f"startup  import {module:<23} {results['startup'][module]['seconds']:>10.4f} s")
+    problems = check_startup(results['startup'])
+
+    if not args.startup_only:
+        # fit_model imports sklearn on its first call: it is imported here, so that the train stage of the first tier
+        # only measures the fit
+        start = time.perf_counter()
+        import sklearn.linear_model  # noqa: F401
+        results['sklearn_import_seconds'] = time.perf_counter() - start
+        print(f"startup  import {'sklearn.linear_model':<23} {results['sklearn_import_seconds']:>10.4f} s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for tier in [] if args.startup_only else args.tiers:
+            profiler = None
+            if args.profile:
+                profiler = StageProfiler()
+                set_profiler(profiler)
+            results['tiers'][tier] = run_tier(tier, TIERS[tier], directory, args.seed, profiler)
+            if profiler is not None:
+                set_profiler(None)
+                results.setdefault('profiles', {})[tier] = profiler.report()
+                profiler.print_report()
+            for stage, measures in results['tiers'][tier].items():
+                print(f"{tier:<8} {stage:<30} {measures['seconds']:>10.4f} s {measures['peak_memory_bytes'] / 2 ** 20:>10.2f} MiB")
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    for problem in problems:
+        print(f"Startup: {problem}")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline)
+        for tier, stage, ratio in regressions:
+            print(f"Regression: {tier} {stage} is {ratio:.2f}x slower than the baseline")
+    if regressions or problems:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import heapq
+from collections import deque
+
+MAIN_TYPES = ['main dish', 'single dish']
+
+
+class CandidateRanking:
+    """
+    Lazily ranks the predictions in order of probability, separating main dishes (main and single dishes) from sides.
+    The predictions with a "score", e.g. from PantryCoverage.rank, are ranked by score instead.
+
+    The predictions are put in a heap in O(R) and each candidate costs O(log R) only when it is requested, so the
+    first suggestions are available without sorting the whole catalog. The recipe details are read from the catalog
+    only for the candidates that are actually yielded.
+    """
+
+    def __init__(self, predictions, catalog):
+        self.catalog = catalog
+        self.heap = [(-prediction.get('score', prediction['probability']), prediction['id'])
+                     for prediction in predictions]
+        heapq.heapify(self.heap)
+        # candidates popped from the heap while looking for the other kind of dish
+        self.pending = {True: deque(), False: deque()}
+
+    def _next(self, main):
+        """
+        Returns the id of the next most likely main dish (or side if main is False), None when there are no more.
+        """
+        if self.pending[main]:
+            return self.pending[main].popleft()
+
+        while self.heap:
+            probability, recipe_id = heapq.heappop(self.heap)
+            recipe_type = self.catalog.types.get(recipe_id)
+            if recipe_type is None:
+                continue
+            if (recipe_type in MAIN_TYPES) == main:
+                return recipe_id
+            self.pending[not main].append(recipe_id)
+
+        return None
+
+    def _candidates(self, main):
+        while True:
+            recipe_id = self._next(main)
+            if recipe_id is None:
+                return
+            yield self.catalog.get(recipe_id)
+
+    def main_dishes(self):
+        """
+        Generator of the main and single dishes, as Recipe records, from the most to the least likely.
+        """
+        return self._candidates(True)
+
+    def sides(self):
+        """
+        Generator of the side dishes, as Recipe records, from the most to the least likely.
+        """
+        return self._candidates(False)
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+from Instrumentation import InstrumentedConnection
+
+
+class ConnectionPool:
+    """
+    Gives every thread its own connections to a SQLite database, so that a Database can be shared between threads.
+    Connections are only used by the thread that opened them, but can be closed by any thread.
+
+    The database is switched to WAL mode, in which readers do not wait for the writer. Each thread gets a read-write
+    connection, that starts its transactions with BEGIN IMMEDIATE so that concurrent writers queue on the SQLite lock
+    (for at most timeout seconds) instead of failing half-way, and, on request, a read-only connection for queries.
+    The write_lock serializes the batches of the threads of the process.
+
+    An in-memory database cannot be shared between connections, so all threads use the same connection, and the same
+    transaction (see Database.batch_depth).
+
+    The connections record their statements in instrumentation, when it is set (see Database.enable_instrumentation).
+    """
+
+    def __init__(self, db_file, timeout=30.0):
+        self.db_file = db_file
+        self.timeout = timeout
+        self.local = threading.local()
+        self.write_lock = threading.RLock()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.instrumentation = None
+
+        self.shared = None
+        if db_file == ':memory:':
+            self.shared = sqlite3.connect(db_file, check_same_thread=False, factory=InstrumentedConnection)
+            self.shared.pool = self
+
+    def _register(self, connection):
+        connection.pool = self
+        with self.connections_lock:
+            self.connections.append(connection)
+        return connection
+
+    def writer(self):
+        """
+        Returns the read-write connection of the current thread, opening it the first time.
+        """
+        if self.shared is not None:
+            return self.shared
+
+        connection = getattr(self.local, 'writer', None)
+        if connection is None:
+            connection = self._register(sqlite3.connect(self.db_file, timeout=self.timeout,
+                                                        isolation_level='IMMEDIATE', check_same_thread=False,
+                                                        factory=InstrumentedConnection))
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.writer = connection
+        return connection
+
+    def reader(self):
+        """
+        Returns the read-only connection of the current thread, opening it the first time.
+        """
+        if self.shared is not None:
+            return self.shared
+
+        connection = getattr(self.local, 'reader', None)
+        if connection is None:
+            uri = f"file:{pathname2url(os.path.abspath(self.db_file))}?mode=ro"
+            connection = self._register(sqlite3.connect(uri, uri=True, timeout=self.timeout,
+                                                        check_same_thread=False, factory=InstrumentedConnection))
+            self.local.reader = connection
+        return connection
+
+    def close(self):
+        """
+        Closes the connections of all the threads.
+        """
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        if self.shared is not None:
+            self.shared.close()
+        self.local = threading.local()
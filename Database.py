@@ -1,147 +1,232 @@
+import csv
 import sqlite3
+import threading
+import time
+import types
+from contextlib import contextmanager
+from datetime import date as Date, timedelta
 from sqlite3 import Error
-import pandas as pd
+import numpy as np
+from ConnectionPool import ConnectionPool
+from Instrumentation import Instrumentation
+from Migrations import EPOCH_DAY_SQL, migrate
+from ReadCache import ReadCache, cache_key, cached, integer_key
+from Records import (INGREDIENT_DTYPES, MEAL_HISTORY_DTYPES, RECIPE_DTYPES, SCORING_DTYPES, Ingredient,
+                     MealHistoryEntry, Profile, Recipe, RecipeFeatures, StoredPortions, columns, row_factory)
+from Seasonality import recipe_season_mask
+
+# Day 0 of the integer dates of the meal history
+EPOCH = Date(1970, 1, 1)
 
 
 class Database:
-    def __init__(self, db_file):
+    def __init__(self, db_file, cache_size=0):
         """
         Initialize database connection.
         Create tables if they do not exist.
-        """
-        self.conn = None
+        Every thread using the database gets its own connections from the pool.
+        If cache_size is not 0, the results of the point lookups (get_recipe_by_id, get_recipe_ingredients,
+        get_profile, get_all_profiles, get_ingredient) are kept in a read cache of at most cache_size entries.
+        """
+        self.pool = None
+        self.db_file = db_file
+        # per-thread state, such as the number of open batches
+        self.local = threading.local()
+        self.cache = None
+        self.instrumentation = None
+        # the error that kept the database from being opened, if any
+        self.open_error = None
         try:
-            self.conn = sqlite3.connect(db_file)
+            self.pool = ConnectionPool(db_file)
+            self.pool.writer()
         except Error as e:
             print(e)
-
-        if self.conn:
+            self.pool = None
+            self.open_error = e
+
+        if self.pool:
+            if self.pool.shared is not None:
+                # the threads of an in-memory database share its connection, and so its transaction: the batch
+                # state must be shared as well, or a thread would commit or roll back the batch of another one
+                self.local = types.SimpleNamespace()
             self.create_tables()
+        if cache_size:
+            self.cache = ReadCache(cache_size)
 
-    def create_tables(self):
-        """ Create tables in the SQLite database"""
-        # Ingredients table
-        ingredients_table = """ CREATE TABLE IF NOT EXISTS ingredients (
-                                    name text PRIMARY KEY,
-                                    type text NOT NULL CHECK(type IN ('beef', 'pork', 'chicken', 'fish', 'vegetables', 'animal origin', 'legumes', 'cerial', 'fruit', 'other')),
-                                    seasonality_start integer,
-                                    seasonality_end integer,
-                                    contains_gluten integer NOT NULL
-                                ); """
-
-        # Recipes table
-        # Note: Many-to-many relationship and quantities will be handled separately
-        recipes_table = """ CREATE TABLE IF NOT EXISTS recipes (
-                                id integer PRIMARY KEY,
-                                name text NOT NULL,
-                                type text NOT NULL CHECK(type IN ('single dish', 'main dish', 'side dish')),
-                                time_to_prepare integer NOT NULL,
-                                portions integer NOT NULL,
-                                preservation_days integer NOT NULL,
-                                can_be_frozen integer,
-                                score integer NOT NULL DEFAULT 0
-                            ); """
-
-        # Profiles table
-        # Note: Many-to-many relationship with intolerances will be handled separately
-        profiles_table = """ CREATE TABLE IF NOT EXISTS profiles (
-                                name text PRIMARY KEY,
-                                celiac integer NOT NULL
-                            ); """
-
-        # Recipe-Ingredients table (for many-to-many relationship and quantities)
-        recipe_ingredients_table = """ CREATE TABLE IF NOT EXISTS recipe_ingredients (
-                                                    recipe_id integer,
-                                                    ingredient_name text,
-                                                    quantity integer,
-                                                    PRIMARY KEY(recipe_id, ingredient_name),
-                                                    FOREIGN KEY(recipe_id) REFERENCES recipes(id),
-                                                    FOREIGN KEY(ingredient_name) REFERENCES ingredients(name)
-                                                ); """
-
-        # Profile-Intolerances table (for many-to-many relationship)
-        profile_intolerances_table = """ CREATE TABLE IF NOT EXISTS profile_intolerances (
-                                                    profile_name text,
-                                                    ingredient_name text,
-                                                    PRIMARY KEY(profile_name, ingredient_name),
-                                                    FOREIGN KEY(profile_name) REFERENCES profiles(name),
-                                                    FOREIGN KEY(ingredient_name) REFERENCES ingredients(name)
-                                                ); """
-        # Storage table
-        storage_table = """ CREATE TABLE IF NOT EXISTS storage (
-                                ingredient_name text PRIMARY KEY,
-                                quantity integer NOT NULL,
-                                FOREIGN KEY(ingredient_name) REFERENCES ingredients(name)
-                            ); """
-
-        # Fridge table
-        fridge_table = """ CREATE TABLE IF NOT EXISTS fridge (
-                                recipe_id integer PRIMARY KEY,
-                                portions integer NOT NULL,
-                                FOREIGN KEY(recipe_id) REFERENCES recipes(id)
-                            ); """
-        # Freezer table
-        freezer_table = """ CREATE TABLE IF NOT EXISTS freezer (
-                                recipe_id integer PRIMARY KEY,
-                                portions integer NOT NULL,
-                                FOREIGN KEY(recipe_id) REFERENCES recipes(id)
-                            ); """
-
-        weekly_meal_plan_table = """ CREATE TABLE IF NOT EXISTS weekly_meal_plan (
-                                        meal_id text PRIMARY KEY,
-                                        day text NOT NULL CHECK(day IN ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')),
-                                        meal text NOT NULL CHECK(meal IN ('lunch', 'dinner')),
-                                        location text NOT NULL CHECK(location IN ('home', 'work')),
-                                        recipe_id integer,
-                                        FOREIGN KEY(recipe_id) REFERENCES recipes(id)
-                                    ); """
-        meal_profiles_table = """ CREATE TABLE IF NOT EXISTS meal_profiles (
-                                    meal_id text,
-                                    profile_name text,
-                                    PRIMARY KEY(meal_id, profile_name),
-                                    FOREIGN KEY(meal_id) REFERENCES weekly_meal_plan(meal_id),
-                                    FOREIGN KEY(profile_name) REFERENCES profiles(name)
-                                ); """
-        meal_history_table = """ CREATE TABLE IF NOT EXISTS meal_history (
-                                    id integer PRIMARY KEY,
-                                    recipe_id integer NOT NULL,
-                                    date text NOT NULL,
-                                    in_season integer NOT NULL,
-                                    score integer NOT NULL,
-                                    accepted integer NOT NULL,
-                                    FOREIGN KEY(recipe_id) REFERENCES recipes(id)
-                                ); """
+    @property
+    def conn(self):
+        """
+        The read-write connection of the current thread, used by all the methods that change the database.
+        """
+        if self.pool is None:
+            return None
+        return self.pool.writer()
 
-        try:
-            self.conn.execute(ingredients_table)
-            self.conn.execute(recipes_table)
-            self.conn.execute(profiles_table)
-            self.conn.execute(recipe_ingredients_table)
-            self.conn.execute(profile_intolerances_table)
-            self.conn.execute(recipe_ingredients_table)
-            self.conn.execute(profile_intolerances_table)
-            self.conn.execute(storage_table)
-            self.conn.execute(fridge_table)
-            self.conn.execute(freezer_table)
-            self.conn.execute(weekly_meal_plan_table)
-            self.conn.execute(meal_profiles_table)
-            self.conn.execute(meal_history_table)
+    @property
+    def reader(self):
+        """
+        The read-only connection of the current thread, used by the query-heavy methods.
+        Inside a batch, or while the thread has uncommitted changes, it is the read-write connection, so that the
+        queries see those changes.
+        """
+        if self.batch_depth > 0 or self.conn.in_transaction:
+            return self.conn
+        return self.pool.reader()
 
-        except Error as e:
-            print(e)
+    @property
+    def batch_depth(self):
+        """
+        The number of batches open in the current thread, changes are only committed when the outermost one ends.
+        For an in-memory database it is the number of batches open on its single connection: the changes that the
+        other threads make meanwhile are part of the batch, committed or rolled back with it.
+        """
+        return getattr(self.local, 'batch_depth', 0)
+
+    @batch_depth.setter
+    def batch_depth(self, value):
+        self.local.batch_depth = value
+
+    def close(self):
+        """
+        Close the connections of all the threads.
+        """
+        if self.pool is not None:
+            self.pool.close()
+
+    def enable_instrumentation(self, slow_threshold=0.05):
+        """
+        Start recording the calls of the methods of the database and the statements they run, in all threads.
+
+        Parameters:
+        slow_threshold (float): statements taking at least these seconds go to the slow query log with their plan.
+
+        Returns:
+        Instrumentation: the statistics, see Instrumentation.stats and Instrumentation.dump_json.
+        """
+        self.disable_instrumentation()
+        instrumentation = Instrumentation(slow_threshold)
+        for name in dir(Database):
+            # the COMMIT statements are counted under the method that commits, to find the ones that commit too often
+            if name.startswith('_') or name in ['batch', 'close', 'commit', 'enable_instrumentation',
+                                                'disable_instrumentation']:
+                continue
+            if callable(getattr(Database, name)):
+                # the wrapper is an attribute of this object only, that hides the method of the class
+                setattr(self, name, instrumentation.wrap(name, getattr(self, name)))
+        self.pool.instrumentation = instrumentation
+        self.instrumentation = instrumentation
+        return instrumentation
+
+    def disable_instrumentation(self):
+        """
+        Stop recording, the statistics collected so far remain available in the Instrumentation object.
+        """
+        if self.instrumentation is None:
+            return
+        for name in self.instrumentation.wrapped:
+            delattr(self, name)
+        self.pool.instrumentation = None
+        self.instrumentation = None
+
+    def create_tables(self):
+        """ Create the tables in the SQLite database, or upgrade them to the latest schema version"""
+        migrate(self)
 
         # ... remaining methods ...
 
+    def commit(self):
+        """
+        Commit the pending changes, unless a batch is open: in that case they are committed when the batch ends.
+        """
+        if self.batch_depth == 0:
+            self.conn.commit()
+            self._flush_invalidations()
+
+    @contextmanager
+    def batch(self):
+        """
+        Group many changes in a single transaction:
+
+            with db.batch():
+                db.add_ingredient(...)
+                db.add_recipe(...)
+
+        The methods called inside the block do not commit, everything is committed at the end of the outermost
+        batch, or rolled back if an exception is raised. A nested batch is a savepoint: if an exception is raised in
+        it, only its own changes are rolled back, and the outer batch can catch the exception and go on.
+        Batches of different threads run one at a time.
+        """
+        with self.pool.write_lock:
+            self.batch_depth += 1
+            savepoint = None
+            if self.batch_depth > 1:
+                # a savepoint outside a transaction would start one, that its release would commit
+                if not self.conn.in_transaction:
+                    self.conn.execute('BEGIN IMMEDIATE')
+                savepoint = f"batch_{self.batch_depth}"
+                self.conn.execute(f'SAVEPOINT {savepoint}')
+            try:
+                yield self
+            except BaseException:
+                self.batch_depth -= 1
+                if savepoint is not None:
+                    self.conn.execute(f'ROLLBACK TO {savepoint}')
+                    self.conn.execute(f'RELEASE {savepoint}')
+                elif self.batch_depth == 0:
+                    self.conn.rollback()
+                    self._flush_invalidations()
+                raise
+            self.batch_depth -= 1
+            if savepoint is not None:
+                self.conn.execute(f'RELEASE {savepoint}')
+            elif self.batch_depth == 0:
+                self.conn.commit()
+                self._flush_invalidations()
+
+    def _invalidate(self, method_name, *args):
+        """
+        Remove from the read cache the result of a point lookup whose rows are being changed.
+        The entry is removed again when the transaction ends, since another thread may have read it meanwhile from the
+        last committed data.
+        """
+        if self.cache is None:
+            return
+        key = cache_key(getattr(Database, method_name), args)
+        self.cache.invalidate([key])
+        if self.batch_depth > 0 or self.conn.in_transaction:
+            if not hasattr(self.local, 'stale'):
+                self.local.stale = []
+            self.local.stale.append(key)
+
+    def _flush_invalidations(self):
+        stale = getattr(self.local, 'stale', None)
+        if self.cache is not None and stale:
+            self.cache.invalidate(stale)
+            self.local.stale = []
+
     def add_ingredient(self, ingredient):
         """
         Add a new ingredient to the database.
         If the ingredient exists, delete the existing one and insert the new one.
         """
+        self.add_ingredients([ingredient])
+
+    def add_ingredients(self, ingredients):
+        """
+        Add many ingredients to the database in a single transaction.
+        `ingredients` is a list of tuples (name, type, seasonality_start, seasonality_end, contains_gluten).
+        """
         sql = ''' REPLACE INTO ingredients(name, type, seasonality_start, seasonality_end, contains_gluten)
                   VALUES(?,?,?,?,?) '''
-        cur = self.conn.cursor()
-        cur.execute(sql, ingredient)
-        self.conn.commit()
+        ingredients = list(ingredients)
+        with self.batch():
+            cur = self.conn.cursor()
+            cur.executemany(sql, ingredients)
+            recipe_ids = self.update_ingredient_season_masks([ingredient[0] for ingredient in ingredients])
+            for ingredient in ingredients:
+                self._invalidate('get_ingredient', ingredient[0])
+            for recipe_id in recipe_ids:
+                self._invalidate('get_recipe_ingredients', recipe_id)
 
     def delete_ingredient(self, name):
         """
@@ -150,7 +235,10 @@ class Database:
         sql = 'DELETE FROM ingredients WHERE name=?'
         cur = self.conn.cursor()
         cur.execute(sql, (name,))
-        self.conn.commit()
+        self._invalidate('get_ingredient', name)
+        self.commit()
+        for recipe_id in self.update_ingredient_season_masks([name]):
+            self._invalidate('get_recipe_ingredients', recipe_id)
 
     def print_ingredient(self, name):
         """
@@ -188,18 +276,30 @@ class Database:
         `recipe` is a tuple containing the values for the fields of the recipe (id, name, type, time_to_prepare, portions, preservation_days, can_be_frozen, score)
         `ingredients` is a list of tuples, each containing the name of the ingredient and its quantity.
         """
+        self.add_recipes([(recipe, ingredients)])
+
+    def add_recipes(self, recipes):
+        """
+        Add many recipes to the database in a single transaction.
+        `recipes` is a list of (recipe, ingredients) pairs, in the format of add_recipe.
+        """
+        recipes = list(recipes)
         sql = ''' REPLACE INTO recipes(id, name, type, time_to_prepare, portions, preservation_days, can_be_frozen, score)
                   VALUES(?,?,?,?,?,?,?,?) '''
-        cur = self.conn.cursor()
-        cur.execute(sql, recipe)
-        self.conn.commit()
+        with self.batch():
+            cur = self.conn.cursor()
+            cur.executemany(sql, [recipe for recipe, ingredients in recipes])
 
-        # Handle ingredients and their quantities
-        for ingredient in ingredients:
+            # Handle ingredients and their quantities
             sql = ''' REPLACE INTO recipe_ingredients(recipe_id, ingredient_name, quantity)
                       VALUES(?,?,?) '''
-            cur.execute(sql, (recipe[0], ingredient[0], ingredient[1]))
-            self.conn.commit()
+            cur.executemany(sql, [(recipe[0], ingredient[0], ingredient[1])
+                                  for recipe, ingredients in recipes for ingredient in ingredients])
+
+            self.update_season_masks([recipe[0] for recipe, ingredients in recipes])
+            for recipe, ingredients in recipes:
+                self._invalidate('get_recipe_by_id', recipe[0])
+                self._invalidate('get_recipe_ingredients', recipe[0])
 
     def delete_recipe(self, id):
         """
@@ -208,7 +308,10 @@ class Database:
         sql = 'DELETE FROM recipes WHERE id=?'
         cur = self.conn.cursor()
         cur.execute(sql, (id,))
-        self.conn.commit()
+        cur.execute('DELETE FROM recipe_seasons WHERE recipe_id=?', (id,))
+        self._invalidate('get_recipe_by_id', id)
+        self._invalidate('get_recipe_ingredients', id)
+        self.commit()
 
     def print_recipe(self, id):
         """
@@ -247,7 +350,7 @@ class Database:
                 f"ID: {row[0]}, Name: {row[1]}, Type: {row[2]}, Time to prepare: {row[3]}, Portions: {row[4]}, Preservation days: {row[5]}, Can be frozen: {row[6]}, Score: {row[7]}")
 
     def update_recipe_score(self, recipe_id, increment):
-        """Update the score of a recipe"""
+        """Update the score of a recipe, and its copy in recipe_features through a trigger"""
         if increment not in [-1, 1]:
             print("The score increment is wrong. It should be 1 or -1.")
             proceed = input("Do you want to modify the score anyway? (yes/no): ")
@@ -259,13 +362,83 @@ class Database:
                 cur = self.conn.cursor()
                 # Execute the UPDATE statement
                 cur.execute("UPDATE recipes SET score = score + ? WHERE id = ?", (increment, recipe_id,))
+                self._invalidate('get_recipe_by_id', recipe_id)
                 # Commit the changes
-                self.conn.commit()
+                self.commit()
             except Error as e:
                 print(e)
         else:
             print("Error! Cannot create the database connection.")
 
+    def update_season_masks(self, recipe_ids=None):
+        """
+        Recomputes and stores the months in which the recipes are in season.
+        A recipe is in season in the months in which all of its ingredients are in season.
+
+        Parameters:
+        recipe_ids (list): The IDs of the recipes to update, all the recipes if None.
+        """
+        sql = """SELECT r.id, i.seasonality_start, i.seasonality_end
+                 FROM recipes AS r
+                 LEFT JOIN recipe_ingredients AS ri ON ri.recipe_id = r.id
+                 LEFT JOIN ingredients AS i ON ri.ingredient_name = i.name"""
+        cur = self.conn.cursor()
+
+        if recipe_ids is None:
+            batches = [None]
+        else:
+            recipe_ids = list(recipe_ids)
+            # keeps the number of parameters of each query below the SQLite limit
+            batches = [recipe_ids[i:i + 500] for i in range(0, len(recipe_ids), 500)]
+
+        for batch in batches:
+            if batch is None:
+                cur.execute(sql)
+            else:
+                cur.execute(f"{sql} WHERE r.id IN ({','.join(['?'] * len(batch))})", batch)
+
+            seasons = {}
+            for recipe_id, seasonality_start, seasonality_end in cur.fetchall():
+                seasons.setdefault(recipe_id, []).append((seasonality_start, seasonality_end))
+
+            cur.executemany('REPLACE INTO recipe_seasons(recipe_id, season_mask) VALUES(?, ?)',
+                            [(recipe_id, recipe_season_mask(ranges)) for recipe_id, ranges in seasons.items()])
+        self.commit()
+
+    def update_ingredient_season_masks(self, ingredient_names):
+        """
+        Recomputes the season of all the recipes that use some ingredients.
+
+        Parameters:
+        ingredient_names (list): The names of the ingredients that changed.
+
+        Returns:
+        list: The IDs of the recipes that use the ingredients.
+        """
+        ingredient_names = list(ingredient_names)
+        cur = self.conn.cursor()
+        recipe_ids = set()
+        for i in range(0, len(ingredient_names), 500):
+            batch = ingredient_names[i:i + 500]
+            cur.execute(f"SELECT DISTINCT recipe_id FROM recipe_ingredients "
+                        f"WHERE ingredient_name IN ({','.join(['?'] * len(batch))})", batch)
+            recipe_ids.update(row[0] for row in cur.fetchall())
+        if recipe_ids:
+            self.update_season_masks(sorted(recipe_ids))
+        return sorted(recipe_ids)
+
+    def get_season_masks(self):
+        """
+        Retrieves the months in which every recipe is in season.
+
+        Returns:
+        dict: recipe id -> 12-bit mask of the months in season, bit 0 is January.
+        """
+        cur = self.conn.cursor()
+        cur.execute('SELECT recipe_id, season_mask FROM recipe_seasons')
+        return dict(cur.fetchall())
+
+    @cached(normalize=integer_key)
     def get_recipe_ingredients(self, recipe_id):
         """
         Retrieves the ingredients and their quantities for a recipe by its id, along with additional information
@@ -299,18 +472,29 @@ class Database:
         `profile` is a tuple containing the values for the fields of the profile (name, celiac)
         `intolerances` is a list of ingredient names.
         """
+        self.add_profiles([(profile, intolerances)])
+
+    def add_profiles(self, profiles):
+        """
+        Add many profiles to the database in a single transaction.
+        `profiles` is a list of (profile, intolerances) pairs, in the format of add_profile.
+        """
+        profiles = list(profiles)
         sql = ''' REPLACE INTO profiles(name, celiac)
                   VALUES(?,?) '''
-        cur = self.conn.cursor()
-        cur.execute(sql, profile)
-        self.conn.commit()
+        with self.batch():
+            cur = self.conn.cursor()
+            cur.executemany(sql, [profile for profile, intolerances in profiles])
 
-        # Handle intolerances
-        for ingredient in intolerances:
+            # Handle intolerances
             sql = ''' REPLACE INTO profile_intolerances(profile_name, ingredient_name)
                       VALUES(?,?) '''
-            cur.execute(sql, (profile[0], ingredient))
-            self.conn.commit()
+            cur.executemany(sql, [(profile[0], ingredient)
+                                  for profile, intolerances in profiles for ingredient in intolerances])
+
+            for profile, intolerances in profiles:
+                self._invalidate('get_profile', profile[0])
+            self._invalidate('get_all_profiles')
 
     def delete_profile(self, name):
         """
@@ -319,7 +503,9 @@ class Database:
         sql = 'DELETE FROM profiles WHERE name=?'
         cur = self.conn.cursor()
         cur.execute(sql, (name,))
-        self.conn.commit()
+        self._invalidate('get_profile', name)
+        self._invalidate('get_all_profiles')
+        self.commit()
 
     def print_profile(self, name):
         """
@@ -342,12 +528,14 @@ class Database:
         for row in rows:
             print(f"Ingredient: {row[0]}")
 
+    @cached()
     def get_profile(self, name):
         """
-        Print a profile's details by its name.
+        Return a profile's details by its name, as a Profile record.
         """
-        sql = 'SELECT * FROM profiles WHERE name=?'
+        sql = f'SELECT {columns(Profile)} FROM profiles WHERE name=?'
         cur = self.conn.cursor()
+        cur.row_factory = row_factory(Profile)
         cur.execute(sql, (name,))
         rows = cur.fetchall()
 
@@ -367,6 +555,7 @@ class Database:
         for row in rows:
             print(f"Name: {row[0]}, Celiac: {row[1]}")
 
+    @cached()
     def get_all_profiles(self):
         """
         Retrieve all profiles in the database.
@@ -388,6 +577,18 @@ class Database:
 
         return profiles
 
+    def get_all_profile_intolerances(self):
+        """
+        Retrieves the intolerances of all profiles.
+
+        Returns:
+        list: A list of tuples (profile_name, ingredient_name).
+        """
+        sql = 'SELECT profile_name, ingredient_name FROM profile_intolerances'
+        cur = self.conn.cursor()
+        cur.execute(sql)
+        return cur.fetchall()
+
     def add_to_storage(self, ingredient, quantity):
         """
         Add an ingredient to storage or update the quantity if it already exists.
@@ -395,7 +596,17 @@ class Database:
         sql = 'REPLACE INTO storage(ingredient_name, quantity) VALUES(?, ?)'
         cur = self.conn.cursor()
         cur.execute(sql, (ingredient, quantity))
-        self.conn.commit()
+        self.commit()
+
+    def add_to_storage_many(self, items):
+        """
+        Add many ingredients to storage, or update their quantity, in a single transaction.
+        `items` is a list of tuples (ingredient, quantity).
+        """
+        sql = 'REPLACE INTO storage(ingredient_name, quantity) VALUES(?, ?)'
+        with self.batch():
+            cur = self.conn.cursor()
+            cur.executemany(sql, items)
 
     def delete_from_storage(self, ingredient):
         """
@@ -404,7 +615,7 @@ class Database:
         sql = 'DELETE FROM storage WHERE ingredient_name=?'
         cur = self.conn.cursor()
         cur.execute(sql, (ingredient,))
-        self.conn.commit()
+        self.commit()
 
     def modify_storage_quantity(self, ingredient, quantity):
         """
@@ -413,7 +624,35 @@ class Database:
         sql = 'UPDATE storage SET quantity = ? WHERE ingredient_name = ?'
         cur = self.conn.cursor()
         cur.execute(sql, (quantity, ingredient))
-        self.conn.commit()
+        self.commit()
+
+    def get_storage_quantities(self):
+        """
+        Retrieves the quantity of every ingredient in storage.
+
+        Returns:
+        dict: ingredient name -> quantity.
+        """
+        cur = self.reader.cursor()
+        cur.execute('SELECT ingredient_name, quantity FROM storage')
+        return dict(cur.fetchall())
+
+    def get_storage_changes(self, version):
+        """
+        Retrieves the ingredients whose quantity in storage changed after a version of the storage.
+
+        Parameters:
+        version (int): storage version, as returned by get_storage_version, after which the changes are returned.
+
+        Returns:
+        dict: ingredient name -> quantity, None for the ingredients removed from storage.
+        """
+        # read on the connection of get_storage_version, which also sees the changes of an open batch
+        cur = self.conn.cursor()
+        cur.execute("""SELECT c.ingredient_name, s.quantity FROM storage_changes c
+                       LEFT JOIN storage s ON s.ingredient_name = c.ingredient_name
+                       WHERE c.version > ?""", (version,))
+        return dict(cur.fetchall())
 
     def add_to_fridge(self, recipe_id, portions):
         """
@@ -422,7 +661,7 @@ class Database:
         sql = 'REPLACE INTO fridge(recipe_id, portions) VALUES(?, ?)'
         cur = self.conn.cursor()
         cur.execute(sql, (recipe_id, portions))
-        self.conn.commit()
+        self.commit()
 
     def delete_from_fridge(self, recipe_id):
         """
@@ -431,7 +670,7 @@ class Database:
         sql = 'DELETE FROM fridge WHERE recipe_id=?'
         cur = self.conn.cursor()
         cur.execute(sql, (recipe_id,))
-        self.conn.commit()
+        self.commit()
 
     def modify_fridge_portions(self, recipe_id, portions):
         """
@@ -440,7 +679,7 @@ class Database:
         sql = 'UPDATE fridge SET portions = ? WHERE recipe_id = ?'
         cur = self.conn.cursor()
         cur.execute(sql, (portions, recipe_id))
-        self.conn.commit()
+        self.commit()
 
     def add_to_freezer(self, recipe_id, portions):
         """
@@ -449,7 +688,7 @@ class Database:
         sql = 'REPLACE INTO freezer(recipe_id, portions) VALUES(?, ?)'
         cur = self.conn.cursor()
         cur.execute(sql, (recipe_id, portions))
-        self.conn.commit()
+        self.commit()
 
     def delete_from_freezer(self, recipe_id):
         """
@@ -458,7 +697,7 @@ class Database:
         sql = 'DELETE FROM freezer WHERE recipe_id=?'
         cur = self.conn.cursor()
         cur.execute(sql, (recipe_id,))
-        self.conn.commit()
+        self.commit()
 
     def modify_freezer_portions(self, recipe_id, portions):
         """
@@ -467,7 +706,7 @@ class Database:
         sql = 'UPDATE freezer SET portions = ? WHERE recipe_id = ?'
         cur = self.conn.cursor()
         cur.execute(sql, (portions, recipe_id))
-        self.conn.commit()
+        self.commit()
 
     def print_storage(self):
         """
@@ -516,7 +755,7 @@ class Database:
         sql = 'INSERT OR IGNORE INTO meal_profiles(meal_id, profile_name) VALUES(?,?)'
         cur = self.conn.cursor()
         cur.execute(sql, (meal_id, profile_name))
-        self.conn.commit()
+        self.commit()
 
     def initialize_weekly_meal_plan(self):
         """
@@ -539,7 +778,7 @@ class Database:
                 sql = 'INSERT OR IGNORE INTO weekly_meal_plan(meal_id, day, meal, location) VALUES(?,?,?,?)'
                 cur.execute(sql, (meal_id, day, meal, 'home'))
 
-        self.conn.commit()
+        self.commit()
 
     def print_weekly_meal_plan(self):
         """
@@ -565,7 +804,7 @@ class Database:
         Return the weekly meal plan including the meals for each day of the week and the profiles that will be present at that meal.
         """
         sql = 'SELECT weekly_meal_plan.meal_id, day, meal, location, group_concat(profile_name), recipe_id FROM weekly_meal_plan LEFT JOIN meal_profiles ON weekly_meal_plan.meal_id = meal_profiles.meal_id GROUP BY weekly_meal_plan.meal_id ORDER BY day'
-        cur = self.conn.cursor()
+        cur = self.reader.cursor()
         cur.execute(sql)
         rows = cur.fetchall()
 
@@ -592,7 +831,17 @@ class Database:
         sql = 'UPDATE weekly_meal_plan SET recipe_id = ? WHERE day = ? AND meal = ?'
         cur = self.conn.cursor()
         cur.execute(sql, (recipe_id, day, meal))
-        self.conn.commit()
+        self.commit()
+
+    def add_recipes_to_meals(self, assignments):
+        """
+        Add recipes to many meals of the weekly meal plan in a single transaction.
+        `assignments` is a list of tuples (recipe_id, day, meal).
+        """
+        sql = 'UPDATE weekly_meal_plan SET recipe_id = ? WHERE day = ? AND meal = ?'
+        cur = self.conn.cursor()
+        cur.executemany(sql, assignments)
+        self.commit()
 
     def modify_meal_location(self, day, meal, location):
         """
@@ -601,45 +850,86 @@ class Database:
         sql = 'UPDATE weekly_meal_plan SET location = ? WHERE day = ? AND meal = ?'
         cur = self.conn.cursor()
         cur.execute(sql, (location, day, meal))
-        self.conn.commit()
+        self.commit()
 
     def add_to_meal_history(self, recipe_id, date, in_season, score, accepted):
         """
-        Add an entry to meal history. If the total number of entries is more than 120, delete the oldest one.
+        Add an entry to meal history. The entries beyond the retention limit (see set_meal_history_limit) are moved to
+        the archive, and the summary of the recipe in recipe_features is updated, by triggers in the same statement.
         """
-        sql = 'INSERT INTO meal_history(recipe_id, date, in_season, score, accepted) VALUES(?, ?, ?, ?, ?)'
+        sql = f"""INSERT INTO meal_history(recipe_id, date, day, in_season, score, accepted)
+                  VALUES(?, ?, {EPOCH_DAY_SQL.format('?')}, ?, ?, ?)"""
         cur = self.conn.cursor()
-        cur.execute(sql, (recipe_id, date, in_season, score, accepted))
-        self.conn.commit()
+        cur.execute(sql, (recipe_id, date, date, in_season, score, accepted))
+        self.commit()
 
-        # Check the number of entries
-        sql = 'SELECT COUNT(*) FROM meal_history'
-        cur.execute(sql)
-        count = cur.fetchone()[0]
+    def get_meal_history_limit(self):
+        """
+        Return the number of entries kept in the meal history, None if the whole history is kept.
+        """
+        cur = self.reader.cursor()
+        cur.execute("SELECT value FROM settings WHERE name = 'meal_history_limit'")
+        row = cur.fetchone()
+        return row[0] if row is not None else None
 
-        if count > 240:
-            # Delete the oldest entry
-            sql = 'DELETE FROM meal_history WHERE id = (SELECT MIN(id) FROM meal_history)'
-            cur.execute(sql)
-            self.conn.commit()
+    def set_meal_history_limit(self, limit):
+        """
+        Set the number of entries kept in the meal history and move the exceeding ones to the archive.
 
-    def get_meal_history(self):
+        Parameters:
+        limit (int): number of entries to keep, None to keep the whole history.
         """
-        Return the entire meal history.
+        if limit is not None and limit < 1:
+            raise ValueError("The meal history limit must be at least 1")
+        self.conn.execute("INSERT OR REPLACE INTO settings(name, value) VALUES('meal_history_limit', ?)", (limit,))
+        self.trim_meal_history()
+
+    def trim_meal_history(self):
         """
-        sql = 'SELECT * FROM meal_history'
+        Move to the archive the entries of the meal history beyond the retention limit.
+        Only needed after the limit changes, the inserts are trimmed by a trigger.
+        """
+        limit = "(SELECT value FROM settings WHERE name = 'meal_history_limit')"
+        threshold = f"(SELECT MAX(id) FROM meal_history) - {limit}"
         cur = self.conn.cursor()
-        cur.execute(sql)
+        cur.execute(f"""INSERT INTO meal_history_archive(history_id, recipe_id, date, day, in_season, score, accepted)
+                        SELECT id, recipe_id, date, day, in_season, score, accepted FROM meal_history
+                        WHERE id <= {threshold} ORDER BY id""")
+        cur.execute(f"DELETE FROM meal_history WHERE id <= {threshold}")
+        self.commit()
+
+    @staticmethod
+    def _meal_history_sql(include_archive):
+        """
+        Query of the meal history, with the columns of MealHistoryEntry.
+        """
+        sql = f'SELECT {columns(MealHistoryEntry)} FROM meal_history'
+        if include_archive:
+            sql = f"""SELECT history_id, recipe_id, date, in_season, score, accepted, day FROM meal_history_archive
+                      UNION ALL {sql}"""
+        return sql
+
+    def get_meal_history(self, include_archive=False):
+        """
+        Return the entire meal history.
+        Each entry has the date both as text ("date") and as the number of days since 1970-01-01 ("day").
+
+        Parameters:
+        include_archive (bool): also return the archived entries, before the recent ones.
+        """
+        cur = self.reader.cursor()
+        cur.execute(self._meal_history_sql(include_archive))
         rows = cur.fetchall()
 
         meal_history = []
 
         for row in rows:
-            id, recipe_id, date, in_season, score, accepted = row
+            id, recipe_id, date, in_season, score, accepted, day = row
             meal_history.append({
                 "id": id,
                 "recipe_id": recipe_id,
                 "date": date,
+                "day": day,
                 "in_season": in_season,
                 "score": score,
                 "accepted": accepted
@@ -647,6 +937,181 @@ class Database:
 
         return meal_history
 
+    def get_meal_history_records(self, include_archive=False):
+        """
+        Return the entire meal history as MealHistoryEntry records, without building a dictionary for each entry.
+
+        Parameters:
+        include_archive (bool): also return the archived entries, before the recent ones.
+        """
+        cur = self.reader.cursor()
+        cur.row_factory = row_factory(MealHistoryEntry)
+        cur.execute(self._meal_history_sql(include_archive))
+        return cur.fetchall()
+
+    def get_meal_history_columns(self, include_archive=False):
+        """
+        Return the entire meal history by column.
+
+        Parameters:
+        include_archive (bool): also return the archived entries, before the recent ones.
+
+        Returns:
+        dict: column name -> NumPy array, with the columns of MealHistoryEntry.
+        """
+        return self._fetch_columns(self._meal_history_sql(include_archive), MEAL_HISTORY_DTYPES)
+
+    def get_meal_history_typed(self, include_archive=False):
+        """
+        Return the entire meal history with the dates as datetime.date objects instead of text.
+        """
+        meal_history = self.get_meal_history(include_archive)
+        for meal in meal_history:
+            if meal["day"] is not None:
+                meal["date"] = EPOCH + timedelta(days=meal["day"])
+        return meal_history
+
+    def get_last_meal_days(self, accepted_only=False):
+        """
+        Return, for every recipe in the meal history, the day of its most recent entry, computed by SQLite.
+
+        Parameters:
+        accepted_only (bool): only consider the entries in which the recipe was accepted.
+
+        Returns:
+        dict: recipe id -> number of days since 1970-01-01 of the most recent entry.
+        """
+        sql = 'SELECT recipe_id, MAX(day) FROM meal_history'
+        if accepted_only:
+            sql += ' WHERE accepted = 1'
+        sql += ' GROUP BY recipe_id'
+        cur = self.reader.cursor()
+        cur.execute(sql)
+        return dict(cur.fetchall())
+
+    def get_last_accepted_days(self):
+        """
+        Return, for every recipe of the catalog accepted at least once, the day of its most recent accepted entry,
+        including the archived history. Read from the recipe_features table, one row per recipe.
+
+        Returns:
+        dict: recipe id -> number of days since 1970-01-01 of the most recent accepted entry.
+        """
+        cur = self.reader.cursor()
+        cur.execute("""SELECT f.recipe_id, f.last_accepted_day FROM recipe_features AS f
+                       JOIN recipes AS r ON r.id = f.recipe_id
+                       WHERE f.last_accepted_day IS NOT NULL""")
+        return dict(cur.fetchall())
+
+    def get_recipe_features(self, recipe_id):
+        """
+        Return the summary of the meal history of a recipe, with its current score and season mask.
+
+        Returns:
+        RecipeFeatures: the summary, None if the recipe is unknown.
+        """
+        cur = self.reader.cursor()
+        cur.row_factory = row_factory(RecipeFeatures)
+        cur.execute(f"SELECT {columns(RecipeFeatures)} FROM recipe_features WHERE recipe_id = ?", (recipe_id,))
+        return cur.fetchone()
+
+    def get_scoring_columns(self):
+        """
+        Return, by column, what the prediction model needs to score every recipe of the catalog: the columns of the
+        recipe and its summary from the recipe_features table, with a single scan.
+
+        Returns:
+        dict: column name -> NumPy array, with the columns of SCORING_DTYPES. The days are NaN for the recipes never
+        proposed (or never accepted), the season mask is NaN for the recipes without one.
+        """
+        sql = """SELECT r.id, r.time_to_prepare, r.portions, r.preservation_days, r.can_be_frozen, f.last_day,
+                        f.last_accepted_day, COALESCE(f.accepted_count, 0), COALESCE(f.rejected_count, 0),
+                        COALESCE(f.score, r.score), f.season_mask
+                 FROM recipes AS r LEFT JOIN recipe_features AS f ON f.recipe_id = r.id"""
+        return self._fetch_columns(sql, SCORING_DTYPES)
+
+    def rebuild_recipe_features(self):
+        """
+        Recompute the recipe_features table from the meal history, its archive, the recipes and their seasons.
+        Only needed if the tables were changed with the triggers disabled, they keep it up to date otherwise.
+        """
+        history = """SELECT recipe_id, day, accepted FROM meal_history
+                     UNION ALL SELECT recipe_id, day, accepted FROM meal_history_archive"""
+        cur = self.conn.cursor()
+        cur.execute('DELETE FROM recipe_features')
+        cur.execute(f"""INSERT INTO recipe_features(recipe_id, last_day, last_accepted_day, accepted_count,
+                                                    rejected_count, score, season_mask)
+                        SELECT ids.recipe_id, h.last_day, h.last_accepted_day, COALESCE(h.accepted_count, 0),
+                               COALESCE(h.rejected_count, 0), r.score, s.season_mask
+                        FROM (SELECT id AS recipe_id FROM recipes UNION SELECT recipe_id FROM ({history})) AS ids
+                        LEFT JOIN (SELECT recipe_id, MAX(day) AS last_day,
+                                          MAX(CASE WHEN accepted = 1 THEN day END) AS last_accepted_day,
+                                          SUM(accepted = 1) AS accepted_count, SUM(accepted != 1) AS rejected_count
+                                   FROM ({history}) GROUP BY recipe_id) AS h ON h.recipe_id = ids.recipe_id
+                        LEFT JOIN recipes AS r ON r.id = ids.recipe_id
+                        LEFT JOIN recipe_seasons AS s ON s.recipe_id = ids.recipe_id""")
+        self.commit()
+
+    def get_data_version(self):
+        """
+        Returns the version counters of the tables the prediction model is trained on.
+        The counters grow every time a row of the table is inserted, updated or deleted.
+
+        Returns:
+        tuple: (meal_history version, recipes version)
+        """
+        cur = self.conn.cursor()
+        cur.execute("SELECT table_name, version FROM data_versions WHERE table_name IN ('meal_history', 'recipes')")
+        versions = dict(cur.fetchall())
+        return versions.get('meal_history', 0), versions.get('recipes', 0)
+
+    def get_catalog_version(self):
+        """
+        Returns the version counter of the recipe catalog, which grows every time a recipe is added or deleted or an
+        ingredient or the ingredients of a recipe change. Score updates do not change it.
+        """
+        cur = self.conn.cursor()
+        cur.execute("SELECT version FROM data_versions WHERE table_name = 'catalog'")
+        row = cur.fetchone()
+        return row[0] if row is not None else 0
+
+    def get_profiles_version(self):
+        """
+        Returns the version counter of the profiles, which grows every time a profile or its intolerances change.
+        """
+        cur = self.conn.cursor()
+        cur.execute("SELECT version FROM data_versions WHERE table_name = 'profiles'")
+        row = cur.fetchone()
+        return row[0] if row is not None else 0
+
+    def get_storage_version(self):
+        """
+        Returns the version counter of the storage, which grows every time the quantity of an ingredient changes.
+        """
+        cur = self.conn.cursor()
+        cur.execute("SELECT version FROM data_versions WHERE table_name = 'storage'")
+        row = cur.fetchone()
+        return row[0] if row is not None else 0
+
+    def get_all_recipe_ingredients(self):
+        """
+        Retrieves the ingredients of all recipes, along with the information about each ingredient, with one query.
+
+        Returns:
+        list: A list of tuples (recipe_id, ingredient_name, quantity, type, seasonality_start, seasonality_end,
+        contains_gluten).
+        """
+        try:
+            cursor = self.reader.cursor()
+            cursor.execute(
+                "SELECT ri.recipe_id, ri.ingredient_name, ri.quantity, i.type, i.seasonality_start, "
+                "i.seasonality_end, i.contains_gluten "
+                "FROM recipe_ingredients AS ri "
+                "JOIN ingredients AS i ON ri.ingredient_name = i.name")
+            return cursor.fetchall()
+        except Error as e:
+            print(e)
+
     def get_recipe_by_name(self, name):
         """
         Retrieves all information about a recipe based on its name.
@@ -655,16 +1120,18 @@ class Database:
         name (str): The name of the recipe.
 
         Returns:
-        dict: A dictionary containing all information about the recipe.
+        Recipe: A record containing all information about the recipe.
         """
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Recipes WHERE name = ?", (name,))
+            cursor.row_factory = row_factory(Recipe)
+            cursor.execute(f"SELECT {columns(Recipe)} FROM Recipes WHERE name = ?", (name,))
             recipe = cursor.fetchone()
             return recipe
         except Error as e:
             print(e)
 
+    @cached(normalize=integer_key)
     def get_recipe_by_id(self, id):
         """
         Retrieves all information about a recipe based on its ID.
@@ -673,11 +1140,12 @@ class Database:
         id (int): The ID of the recipe.
 
         Returns:
-        dict: A dictionary containing all information about the recipe.
+        Recipe: A record containing all information about the recipe.
         """
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Recipes WHERE id = ?", (id,))
+            cursor.row_factory = row_factory(Recipe)
+            cursor.execute(f"SELECT {columns(Recipe)} FROM Recipes WHERE id = ?", (id,))
             recipe = cursor.fetchone()
             return recipe
         except Error as e:
@@ -688,26 +1156,57 @@ class Database:
         Retrieves all recipes in the database.
 
         Returns:
-        list: A list of dictionaries, each containing all information about a recipe.
+        list: A list of Recipe records, each containing all information about a recipe.
         """
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Recipes")
+            cursor = self.reader.cursor()
+            cursor.row_factory = row_factory(Recipe)
+            cursor.execute(f"SELECT {columns(Recipe)} FROM Recipes")
             recipes = cursor.fetchall()
             return recipes
         except Error as e:
             print(e)
 
+    def iter_recipes(self, chunk_size=1000):
+        """
+        Iterates over all recipes in the database without loading them all in memory.
+
+        Parameters:
+        chunk_size (int): The number of recipes fetched at a time.
+
+        Returns:
+        generator: Lists of at most chunk_size Recipe records.
+        """
+        cursor = self.reader.cursor()
+        cursor.row_factory = row_factory(Recipe)
+        cursor.execute(f"SELECT {columns(Recipe)} FROM Recipes")
+        while True:
+            recipes = cursor.fetchmany(chunk_size)
+            if not recipes:
+                break
+            yield recipes
+        cursor.close()
+
+    def get_recipe_columns(self):
+        """
+        Retrieves all recipes in the database by column, without building a tuple for each recipe.
+
+        Returns:
+        dict: column name -> NumPy array, with the columns of Recipe. can_be_frozen is NaN where it is missing.
+        """
+        return self._fetch_columns(f"SELECT {columns(Recipe)} FROM Recipes", RECIPE_DTYPES)
+
     def get_fridge_contents(self):
         """
         Retrieves the contents of the fridge.
 
         Returns:
-        list: A list of dictionaries, each representing a recipe and its quantity in the fridge.
+        list: A list of StoredPortions records (recipe_id, portions), one for each recipe in the fridge.
         """
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Fridge")
+            cursor.row_factory = row_factory(StoredPortions)
+            cursor.execute(f"SELECT {columns(StoredPortions)} FROM Fridge")
             fridge_contents = cursor.fetchall()
             return fridge_contents
         except Error as e:
@@ -718,11 +1217,12 @@ class Database:
         Retrieves the contents of the freezer.
 
         Returns:
-        list: A list of dictionaries, each representing a recipe and its quantity in the freezer.
+        list: A list of StoredPortions records (recipe_id, portions), one for each recipe in the freezer.
         """
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM Freezer")
+            cursor.row_factory = row_factory(StoredPortions)
+            cursor.execute(f"SELECT {columns(StoredPortions)} FROM Freezer")
             freezer_contents = cursor.fetchall()
             return freezer_contents
         except Error as e:
@@ -733,16 +1233,44 @@ class Database:
         Retrieves all ingredients in the database.
 
         Returns:
-        list: A list of tuples, each containing all information about an ingredient.
+        list: A list of Ingredient records, each containing all information about an ingredient.
         """
         try:
             cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM ingredients")
+            cursor.row_factory = row_factory(Ingredient)
+            cursor.execute(f"SELECT {columns(Ingredient)} FROM ingredients")
             ingredients = cursor.fetchall()
             return ingredients
         except Error as e:
             print(e)
 
+    def get_ingredient_columns(self):
+        """
+        Retrieves all ingredients in the database by column.
+
+        Returns:
+        dict: column name -> NumPy array, with the columns of Ingredient. The seasonality is NaN where it is missing.
+        """
+        return self._fetch_columns(f"SELECT {columns(Ingredient)} FROM ingredients", INGREDIENT_DTYPES)
+
+    def _fetch_columns(self, sql, dtypes, parameters=()):
+        """
+        Runs a query and returns its result by column.
+
+        Parameters:
+        sql (str): The query, whose columns are in the order of dtypes.
+        dtypes (dict): column name -> NumPy type of the column.
+
+        Returns:
+        dict: column name -> NumPy array.
+        """
+        cursor = self.reader.cursor()
+        cursor.execute(sql, parameters)
+        rows = cursor.fetchall()
+        values = zip(*rows) if rows else [()] * len(dtypes)
+        return {name: np.array(column, dtype=dtype) for (name, dtype), column in zip(dtypes.items(), values)}
+
+    @cached()
     def get_ingredient(self, ingredient_name):
         """
         Retrieves all information of an ingredient based on its name.
@@ -773,40 +1301,97 @@ class Database:
         except Error as e:
             print(e)
 
-    def load_data_from_csv(self, csv_file, table_name):
-        # Read the CSV file into a DataFrame
-        df = pd.read_csv(csv_file)
-
-        # Convert the DataFrame into a list of tuples
-        data_to_insert = [tuple(row) for row in df.values]
+    def load_data_from_csv(self, csv_file, table_name, chunk_size=50000, reject_file=None, pragmas=None,
+                           replace=False):
+        """
+        Import the rows of a CSV file, whose header contains the column names, into a table.
 
-        # Get the column names from the DataFrame
-        column_names = ','.join(df.columns)
+        The file is read in chunks of chunk_size rows, so the memory used does not depend on its size, and each chunk
+        is inserted with executemany. The whole import is a single transaction. The rows that violate a constraint
+        are written, with the error, to reject_file (the CSV file name followed by '.rejected.csv' by default).
 
-        # Prepare the placeholders for the values
-        placeholders = ','.join(['?'] * len(df.columns))
+        Parameters:
+        csv_file (str): The path of the CSV file.
+        table_name (str): The name of the table.
+        chunk_size (int): The number of rows read and inserted at a time.
+        reject_file (str): The path of the CSV file where the rejected rows are written.
+        pragmas (dict): PRAGMAs applied during the import, e.g. {'journal_mode': 'WAL', 'synchronous': 'OFF'}, and
+        restored at the end. They can only be changed outside of a batch.
+        replace (bool): Replace the existing rows with the same key instead of rejecting the new ones, to refresh a
+        table from an updated file.
 
-        # Prepare the SQL statement
-        sql = f"INSERT INTO {table_name} ({column_names}) VALUES ({placeholders})"
+        Returns:
+        dict: The number of rows read, inserted and rejected, the time taken and the throughput in rows/s.
+        """
+        if reject_file is None:
+            reject_file = csv_file + '.rejected.csv'
 
-        # Use a cursor to interact with the database
         cursor = self.conn.cursor()
-
-        # Iterate over the data to insert
-        for row in data_to_insert:
-            try:
-                # Execute the SQL statement
-                cursor.execute(sql, row)
-
-            except sqlite3.IntegrityError as e:
-                # This catches violations of unique constraints and foreign key constraints
-                print(f"Error inserting {row} into {table_name}: {e}")
-
-        # Commit the changes
-        self.conn.commit()
-
-        # Close the cursor
-        cursor.close()
+        previous_pragmas = {}
+        for name, value in (pragmas or {}).items():
+            previous_pragmas[name] = cursor.execute(f"PRAGMA {name}").fetchone()[0]
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+        # pandas is slow to import and only needed here, so it is not loaded by the programs that never import CSV
+        import pandas as pd
+
+        start = time.perf_counter()
+        read = 0
+        rejected = 0
+        rejects = None
+        try:
+            with self.batch():
+                for chunk in pd.read_csv(csv_file, chunksize=chunk_size):
+                    # Python values, with None instead of NaN, so that sqlite3 can bind them
+                    rows = list(chunk.astype(object).where(chunk.notna(), None).itertuples(index=False, name=None))
+                    read += len(rows)
+
+                    sql = (f"{'REPLACE' if replace else 'INSERT'} INTO {table_name} ({','.join(chunk.columns)}) "
+                           f"VALUES ({','.join(['?'] * len(chunk.columns))})")
+
+                    # If a row of the chunk is rejected the chunk is rolled back and inserted one row at a time
+                    cursor.execute('SAVEPOINT csv_chunk')
+                    try:
+                        cursor.executemany(sql, rows)
+                    except sqlite3.IntegrityError:
+                        cursor.execute('ROLLBACK TO csv_chunk')
+                        for row in rows:
+                            try:
+                                cursor.execute(sql, row)
+                            except sqlite3.IntegrityError as e:
+                                # This catches violations of unique constraints and foreign key constraints
+                                if rejects is None:
+                                    rejects = open(reject_file, 'w', newline='')
+                                    reject_writer = csv.writer(rejects)
+                                    reject_writer.writerow(list(chunk.columns) + ['error'])
+                                reject_writer.writerow(list(row) + [str(e)])
+                                rejected += 1
+                    cursor.execute('RELEASE csv_chunk')
+
+                # The seasons depend on the recipes and on their ingredients
+                if table_name in ['recipes', 'ingredients', 'recipe_ingredients']:
+                    self.update_season_masks()
+        finally:
+            if self.cache is not None:
+                self.cache.clear()
+            if rejects is not None:
+                rejects.close()
+            for name, value in previous_pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+            cursor.close()
+
+        seconds = time.perf_counter() - start
+        report = {
+            "rows": read,
+            "inserted": read - rejected,
+            "rejected": rejected,
+            "seconds": seconds,
+            "rows_per_second": read / seconds if seconds > 0 else 0.0,
+        }
+        print(f"Imported {report['inserted']} of {read} rows into {table_name} in {seconds:.2f} s "
+              f"({report['rows_per_second']:.0f} rows/s)"
+              + (f", {rejected} rejected rows written to {reject_file}" if rejected else ""))
+        return report
 
     # Usage:
     # conn = sqlite3.connect('your_database.db')
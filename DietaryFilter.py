@@ -0,0 +1,121 @@
+import numpy as np
+
+
+class DietaryFilter:
+    """
+    Removes from the catalog the recipes that some participants of a meal cannot eat.
+
+    Every recipe is encoded as a bitset of its ingredients, stored as a row of 64-bit words, plus a gluten flag.
+    A group of participants is compiled into a single exclusion bitset, the union of their intolerances, and a celiac
+    flag; the whole catalog is then checked with one vectorized AND. Compiled groups are cached until the profiles
+    or the catalog change.
+    """
+
+    def __init__(self, db, catalog):
+        self.db = db
+        self.catalog = catalog
+        self.catalog_version = None
+        self.profiles_version = None
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.ingredient_bits = {}
+        self.bitsets = np.zeros((0, 1), dtype=np.uint64)
+        self.gluten = np.zeros(0, dtype=bool)
+        self.profiles = {}
+        self.compiled = {}
+
+    def _encode_catalog(self):
+        """
+        Encodes the recipes of the catalog as ingredient bitsets, if the catalog changed since the last encoding.
+        """
+        catalog = self.catalog.snapshot()
+        if catalog.version == self.catalog_version:
+            return
+
+        self.recipe_ids = np.array(sorted(catalog.recipes), dtype=np.int64)
+        names = sorted({name for ingredients in catalog.ingredients.values() for name in ingredients})
+        self.ingredient_bits = {name: bit for bit, name in enumerate(names)}
+
+        words = max((len(names) + 63) // 64, 1)
+        self.bitsets = np.zeros((len(self.recipe_ids), words), dtype=np.uint64)
+        for row, recipe_id in enumerate(self.recipe_ids.tolist()):
+            for name in catalog.ingredients[recipe_id]:
+                bit = self.ingredient_bits[name]
+                self.bitsets[row, bit // 64] |= np.uint64(1 << (bit % 64))
+
+        self.gluten = np.array([catalog.contains_gluten[recipe_id] for recipe_id in self.recipe_ids.tolist()],
+                               dtype=bool)
+
+        self.catalog_version = catalog.version
+        self.compiled = {}
+
+    def _load_profiles(self):
+        """
+        Loads celiac flag and intolerances of every profile, if the profiles changed since the last load.
+        """
+        version = self.db.get_profiles_version()
+        if version == self.profiles_version:
+            return
+
+        profiles = {profile['name'].lower(): (profile['celiac'] == 1, set())
+                    for profile in self.db.get_all_profiles() or []}
+        for profile_name, ingredient_name in self.db.get_all_profile_intolerances():
+            if profile_name.lower() in profiles:
+                profiles[profile_name.lower()][1].add(ingredient_name)
+
+        self.profiles = profiles
+        self.profiles_version = version
+        self.compiled = {}
+
+    def compile(self, participants):
+        """
+        Compiles a group of participants into the mask of the recipes they can all eat.
+
+        Parameters:
+        participants (list): names of the profiles taking part in the meal.
+
+        Returns:
+        np.ndarray: boolean mask aligned with self.recipe_ids, True for the allowed recipes.
+        """
+        self._encode_catalog()
+        self._load_profiles()
+
+        key = frozenset(participant.lower() for participant in participants)
+        if key in self.compiled:
+            return self.compiled[key]
+
+        exclusion = np.zeros(self.bitsets.shape[1], dtype=np.uint64)
+        celiac = False
+        for participant in key:
+            participant_celiac, intolerances = self.profiles.get(participant, (False, set()))
+            celiac = celiac or participant_celiac
+            for name in intolerances:
+                bit = self.ingredient_bits.get(name)
+                if bit is not None:
+                    exclusion[bit // 64] |= np.uint64(1 << (bit % 64))
+
+        allowed = ~np.any(self.bitsets & exclusion, axis=1)
+        if celiac:
+            allowed &= ~self.gluten
+
+        self.compiled[key] = allowed
+        return allowed
+
+    def filter(self, predictions, participants):
+        """
+        Keeps only the predictions of the recipes that all the participants can eat, preserving their order.
+
+        Parameters:
+        predictions (list): dictionaries with at least the recipe "id".
+        participants (list): names of the profiles taking part in the meal.
+
+        Returns:
+        list: the allowed predictions.
+        """
+        allowed = self.compile(participants)
+        if len(predictions) == 0 or len(self.recipe_ids) == 0:
+            return []
+
+        ids = np.array([prediction['id'] for prediction in predictions], dtype=np.int64)
+        position = np.minimum(np.searchsorted(self.recipe_ids, ids), len(self.recipe_ids) - 1)
+        keep = (self.recipe_ids[position] == ids) & allowed[position]
+        return [prediction for prediction, kept in zip(predictions, keep.tolist()) if kept]
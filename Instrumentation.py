@@ -0,0 +1,305 @@
+import functools
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Latencies kept for each method and statement to estimate the percentiles, a uniform sample of all the calls
+SAMPLES = 1000
+
+
+class Timings:
+    """
+    Call count, total time and rows of a method or statement, with a sample of the latencies for the percentiles.
+    The rows of a method, and its number of queries, are the ones of the statements it ran directly.
+    """
+    __slots__ = ('calls', 'seconds', 'rows', 'queries', 'samples', 'methods')
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.queries = 0
+        self.samples = []
+        self.methods = set()
+
+    def add(self, seconds, rows, rnd):
+        self.calls += 1
+        self.seconds += seconds
+        self.rows += rows
+        # reservoir sampling, every call has the same probability of being in the sample
+        if len(self.samples) < SAMPLES:
+            self.samples.append(seconds)
+        else:
+            index = rnd.randrange(self.calls)
+            if index < SAMPLES:
+                self.samples[index] = seconds
+
+    def summary(self):
+        p50, p99 = np.percentile(self.samples, [50, 99]).tolist() if self.samples else (0.0, 0.0)
+        return {"calls": self.calls, "total_seconds": self.seconds, "p50_seconds": p50, "p99_seconds": p99,
+                "rows": self.rows, "queries": self.queries}
+
+
+class Instrumentation:
+    """
+    Statistics of the Database methods and of the SQL statements they run, collected while the instrumentation of
+    the database is enabled (see Database.enable_instrumentation).
+
+    Every statement is timed from its execution to its last fetched row and attributed to the innermost Database
+    method running in its thread. The statements slower than slow_threshold seconds go to a bounded slow query log,
+    together with their EXPLAIN QUERY PLAN, computed once per statement, so that full table scans are easy to spot.
+    Commits are recorded as the COMMIT statement, to find methods that commit too often.
+    """
+
+    def __init__(self, slow_threshold=0.05, slow_log_size=100):
+        self.slow_threshold = slow_threshold
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.random = random.Random(0)
+        self.methods = {}
+        self.statements = {}
+        self.plans = {}
+        self.slow_queries = deque(maxlen=slow_log_size)
+        # number of statements recorded, of all the threads
+        self.queries = 0
+        # names of the Database methods wrapped by wrap()
+        self.wrapped = []
+
+    def current_method(self):
+        stack = getattr(self.local, 'methods', None)
+        return stack[-1] if stack else None
+
+    def wrap(self, name, method):
+        """
+        Returns a version of a bound method that records its calls.
+        """
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            if not hasattr(self.local, 'methods'):
+                self.local.methods = []
+            self.local.methods.append(name)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                self.local.methods.pop()
+                with self.lock:
+                    if name not in self.methods:
+                        self.methods[name] = Timings()
+                    self.methods[name].add(seconds, 0, self.random)
+
+        self.wrapped.append(name)
+        return wrapper
+
+    def record_statement(self, connection, sql, parameters, seconds, rows):
+        """
+        Records an execution of a statement, explaining it if it is slow.
+
+        Parameters:
+        parameters: the parameters of the statement, None if they are unknown (executemany).
+        """
+        key = ' '.join(sql.split())
+        method = self.current_method()
+        with self.lock:
+            self.queries += 1
+            if key not in self.statements:
+                self.statements[key] = Timings()
+            timings = self.statements[key]
+            timings.add(seconds, rows, self.random)
+            timings.queries += 1
+            timings.methods.add(method)
+            if method is not None:
+                if method not in self.methods:
+                    self.methods[method] = Timings()
+                self.methods[method].rows += rows
+                self.methods[method].queries += 1
+
+        if seconds >= self.slow_threshold:
+            self.slow_queries.append({"sql": key, "method": method, "seconds": seconds, "rows": rows,
+                                      "plan": self._plan(connection, key, sql, parameters)})
+
+    def _plan(self, connection, key, sql, parameters):
+        with self.lock:
+            if key in self.plans:
+                return self.plans[key]
+
+        if parameters is None:
+            # the plan does not depend on the values, only on the placeholders
+            parameters = [None] * sql.count('?')
+        try:
+            # the methods of the base class, so that the EXPLAIN is not recorded itself
+            rows = sqlite3.Connection.execute(connection, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+            plan = [row[3] for row in rows]
+        except sqlite3.Error:
+            # COMMIT, PRAGMA and DDL statements have no plan
+            plan = []
+
+        with self.lock:
+            self.plans[key] = plan
+        return plan
+
+    def stats(self):
+        """
+        Returns the statistics collected so far.
+
+        Returns:
+        dict: methods and statements, each name -> calls, total, p50 and p99 seconds and rows, from the slowest in
+        total; the slow query log; the statements whose plan scans a whole table.
+        """
+        with self.lock:
+            methods = {name: timings.summary() for name, timings in self.methods.items()}
+            statements = {}
+            for sql, timings in self.statements.items():
+                statements[sql] = timings.summary()
+                statements[sql]["methods"] = sorted(str(method) for method in timings.methods)
+            slow_queries = list(self.slow_queries)
+            full_scans = {sql: plan for sql, plan in self.plans.items()
+                          if any(step.startswith('SCAN') and 'INDEX' not in step for step in plan)}
+
+        def slowest_first(items):
+            return dict(sorted(items.items(), key=lambda item: -item[1]["total_seconds"]))
+
+        return {"methods": slowest_first(methods), "statements": slowest_first(statements),
+                "slow_queries": slow_queries, "full_scans": full_scans}
+
+    def dump_json(self, path):
+        """
+        Writes the statistics to a JSON file.
+        """
+        with open(path, 'w') as file:
+            json.dump(self.stats(), file, indent=2)
+
+    def reset(self):
+        """
+        Forgets the statistics collected so far.
+        """
+        with self.lock:
+            self.methods = {}
+            self.statements = {}
+            self.plans = {}
+            self.slow_queries.clear()
+            self.queries = 0
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that reports the time spent on each statement and the rows it returned or changed.
+    """
+
+    def __init__(self, connection, instrumentation):
+        super().__init__(connection)
+        self.instrumentation = instrumentation
+        # [sql, parameters, seconds, rows] of the statement whose rows are being fetched
+        self.statement = None
+
+    def _finish(self):
+        statement = self.statement
+        if statement is not None:
+            self.statement = None
+            self.instrumentation.record_statement(self.connection, *statement)
+
+    def _execute(self, execute, sql, parameters, recorded_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            execute(sql, parameters)
+        finally:
+            self.statement = [sql, recorded_parameters, time.perf_counter() - start, max(self.rowcount, 0)]
+            # statements without rows, or failed, are complete
+            if self.description is None:
+                self._finish()
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._execute(super().execute, sql, parameters, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._execute(super().executemany, sql, seq_of_parameters, None)
+
+    def _fetched(self, start, rows, exhausted):
+        if self.statement is not None:
+            self.statement[2] += time.perf_counter() - start
+            self.statement[3] += rows
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # statements whose rows were not all fetched
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection that hands out InstrumentedCursors while the instrumentation of its pool is enabled, and plain
+    cursors otherwise, so that it costs nothing when disabled.
+    """
+    pool = None
+
+    def _instrumentation(self):
+        return self.pool.instrumentation if self.pool is not None else None
+
+    def cursor(self, factory=None):
+        instrumentation = self._instrumentation()
+        if instrumentation is None:
+            return super().cursor() if factory is None else super().cursor(factory)
+        return InstrumentedCursor(self, instrumentation)
+
+    def execute(self, sql, parameters=()):
+        if self._instrumentation() is None:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if self._instrumentation() is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        instrumentation = self._instrumentation()
+        if instrumentation is None:
+            return super().commit()
+        start = time.perf_counter()
+        super().commit()
+        instrumentation.record_statement(self, 'COMMIT', (), time.perf_counter() - start, 0)
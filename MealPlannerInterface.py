@@ -1,9 +1,29 @@
-from Database import Database
+import os
+import sqlite3
 from datetime import datetime
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
-from sklearn.metrics import accuracy_score, confusion_matrix
+import numpy as np
 from Meals_plan_creator import Meals_plan_creator
+from ModelStore import ModelStore
+from Profiling import StageProfiler, get_profiler, print_stage, profiled, set_profiler
+from Seasonality import ALL_MONTHS
+from ShardManager import ShardManager
+from WeeklyPlanSolver import WeeklyPlanSolver
+
+
+def input_month(question):
+    """
+    Asks for a month from 1 to 12 until a valid one is entered.
+
+    Returns:
+    int: the month, None if the answer is blank.
+    """
+    while True:
+        answer = input(question).strip()
+        if answer == '':
+            return None
+        if answer.isdigit() and 1 <= int(answer) <= 12:
+            return int(answer)
+        print("Invalid month. Please enter a number from 1 to 12, or nothing for no seasonality.")
 
 
 # Here is a Python function which will interactively ask the user for the details needed to add a recipe.
@@ -137,85 +157,119 @@ def replace_none_values_with_average(dataset):
     return dataset
 
 
-def check_season(db, recipe_id):
-    recipe_ingredients = db.get_recipe_ingredients(recipe_id)
-
-    current_month = datetime.now().month
-
-    for ingredient in recipe_ingredients:
-        if ingredient['seasonality_start'] >= current_month and ingredient['seasonality_end'] <= current_month:
-            return 0
-
-    return 1
+# Order of the columns of the feature matrix used both for training and for the predictions
+FEATURE_COLUMNS = ['time_to_prepare', 'portions', 'preservation_days', 'can_be_frozen', 'time_from_last_eaten',
+                   'in_season', 'score']
 
 
-def create_dataset(db):
-    # Get all recipes from the database
-    all_recipes = db.get_all_recipes()
-
-    # Transform it into a dictionary for easier access
-    # Assuming the structure of each recipe is as follows:
-    # (id, name, type, time_to_prepare, portions, preservation_days, can_be_frozen, score)
-    recipes_dict = {recipe[0]: {"name": recipe[1], "type": recipe[2], "time_to_prepare": recipe[3],
-                                "portions": recipe[4], "preservation_days": recipe[5],
-                                "can_be_frozen": recipe[6], "score": recipe[7]} for recipe in all_recipes}
-
-
-    # Get the meal history
-    meal_history = db.get_meal_history()
-    # Sort meal history by date
-    meal_history.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'), reverse=True)
+def days_since_last_accepted(recipe_ids, days, accepted):
+    """
+    For every meal of the history computes how many days passed since the same recipe was last accepted, on or
+    before the date of the meal. Meals whose recipe was never accepted before get 0.
 
-    # Initialize the last eaten dates dictionary
-    last_eaten_dates = {}
+    The history is sorted once by (recipe, date) and a running maximum of the accepted dates is carried inside each
+    recipe group, so the whole computation is O(H log H) instead of comparing every pair of meals.
 
-    # Initialize the dataset
-    dataset = []
+    Parameters:
+    recipe_ids (np.ndarray): recipe id of each meal.
+    days (np.ndarray): date of each meal expressed as integer days.
+    accepted (np.ndarray): 1 if the meal was accepted, 0 otherwise.
 
-    for meal in meal_history:
-        # Get the corresponding recipe
-        recipe = recipes_dict[meal['recipe_id']]
+    Returns:
+    np.ndarray: the number of days since the last accepted meal, aligned with the input arrays.
+    """
+    n = len(days)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    order = np.lexsort((days, recipe_ids))
+    sorted_recipes = recipe_ids[order]
+    sorted_days = days[order]
+    sorted_accepted = accepted[order]
+
+    # shifts the accepted dates to be >= 1 so that 0 can mean "never accepted"
+    first_day = sorted_days.min()
+    span = int(sorted_days.max() - first_day) + 2
+    accepted_days = np.where(sorted_accepted == 1, sorted_days - first_day + 1, 0)
+
+    # running maximum that restarts at each recipe: every group is lifted above all the previous ones
+    new_group = np.empty(n, dtype=bool)
+    new_group[0] = True
+    new_group[1:] = sorted_recipes[1:] != sorted_recipes[:-1]
+    group_offset = (np.cumsum(new_group) - 1) * span
+    last_accepted = np.maximum.accumulate(accepted_days + group_offset) - group_offset
+
+    # meals of the same recipe on the same date all see the accepted meals of that date
+    new_block = new_group.copy()
+    new_block[1:] |= sorted_days[1:] != sorted_days[:-1]
+    block_starts = np.flatnonzero(new_block)
+    block_ends = np.append(block_starts[1:] - 1, n - 1)
+    last_accepted = last_accepted[block_ends[np.cumsum(new_block) - 1]]
+
+    gaps = np.where(last_accepted > 0, sorted_days - first_day + 1 - last_accepted, 0)
+
+    result = np.empty(n, dtype=np.int64)
+    result[order] = gaps
+    return result
+
+
+@profiled('create_dataset')
+def create_dataset(db, include_archive=False):
+    """
+    Builds the training set from the meal history.
 
-        # Calculate time from last eaten
-        current_date = datetime.strptime(meal['date'], '%Y-%m-%d')
+    Every column is computed on NumPy arrays from the integer days of the history, rows are ordered from the most
+    recent meal to the oldest one.
 
-        # for each recipe checks when it was eaten the previous time
-        time_from_last_eaten = 0
+    Parameters:
+    include_archive (bool): also train on the entries moved out of the meal history by the retention limit.
 
-        # print("meal check")
-        for old_meal in meal_history:
-            last_eaten_date = datetime.strptime(old_meal['date'], '%Y-%m-%d')
-            if meal['recipe_id'] == old_meal['recipe_id'] and old_meal[
-                'accepted'] == 1 and last_eaten_date <= current_date:
-                time_from_last_eaten = (current_date - last_eaten_date).days
-                break
-            else:
-                time_from_last_eaten = 0
-
-        # Create the data row
-        data_row = {
-            'time_to_prepare': recipe['time_to_prepare'],
-            'portions': recipe['portions'],
-            'preservation_days': recipe['preservation_days'],
-            'can_be_frozen': recipe['can_be_frozen'],
-            'time_from_last_eaten': time_from_last_eaten,
-            'score': meal['score'],
-            'in_season': meal['in_season'],
-            'accepted': meal['accepted']
-        }
-
-        # Add the data row to the dataset
-        dataset.append(data_row)
-    dataset = replace_none_values_with_average(dataset)
-    print(dataset)
-    return dataset
+    Returns:
+    tuple: (X, y) where X is a float matrix with the columns in FEATURE_COLUMNS and y contains the accepted flags.
+    """
+    # Get all recipes from the database, by column
+    recipes = db.get_recipe_columns()
+    recipe_ids = recipes['id']
+    recipe_features = np.column_stack((recipes['time_to_prepare'], recipes['portions'], recipes['preservation_days'],
+                                       np.nan_to_num(recipes['can_be_frozen']))).astype(float)
+
+    # Get the meal history, by column
+    meal_history = db.get_meal_history_columns(include_archive)
+    history_recipes = meal_history['recipe_id']
+    history_days = meal_history['day']
+    history_in_season = meal_history['in_season'].astype(float)
+    history_score = meal_history['score'].astype(float)
+    history_accepted = meal_history['accepted']
+
+    # Drops the meals whose recipe is no longer in the database
+    sort_ids = np.argsort(recipe_ids)
+    position = np.searchsorted(recipe_ids, history_recipes, sorter=sort_ids)
+    position = np.minimum(position, max(len(recipe_ids) - 1, 0))
+    known = np.zeros(len(history_recipes), dtype=bool)
+    if len(recipe_ids) > 0:
+        known = recipe_ids[sort_ids[position]] == history_recipes
+
+    time_from_last_eaten = days_since_last_accepted(history_recipes, history_days, history_accepted)
+
+    # Most recent meals first, as the history was sorted before
+    order = np.argsort(-history_days, kind='stable')
+    order = order[known[order]]
+
+    X = np.column_stack((recipe_features[sort_ids[position[order]]],
+                         time_from_last_eaten[order],
+                         history_in_season[order],
+                         history_score[order]))
+    y = history_accepted[order]
+    return X, y
 
 
 def train_logistic_regression_check(dataset):
-    # Convert the dataset into features and labels
-    X = [[entry['time_to_prepare'], entry['portions'], entry['preservation_days'], entry['can_be_frozen'],
-          entry['time_from_last_eaten'], entry['in_season'], entry['score']] for entry in dataset]
-    y = [entry['accepted'] for entry in dataset]
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.metrics import accuracy_score, confusion_matrix
+    from sklearn.model_selection import train_test_split
+
+    # The dataset already contains features and labels
+    X, y = dataset
 
     # Split the dataset into a training set and a test set
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -236,80 +290,145 @@ def train_logistic_regression_check(dataset):
     return model, accuracy, confusion_mat
 
 
+def today_day():
+    return int(np.datetime64(datetime.now().date(), 'D').astype(np.int64))
+
+
+def last_eaten_days(db):
+    """
+    Computes, for every recipe accepted at least once, how many days passed since it was last accepted, as the
+    time_from_last_eaten column of the training set.
+
+    Returns:
+    dict: recipe id -> number of days since the most recent accepted meal of that recipe.
+    """
+    today = today_day()
+    return {recipe_id: today - day for recipe_id, day in db.get_last_accepted_days().items()}
+
+
+def recipe_feature_matrix(recipes, last_eaten, average_last_eaten, season_masks):
+    """
+    Assembles the feature matrix of a group of recipes, with the columns in FEATURE_COLUMNS.
+
+    Parameters:
+    recipes (list): Recipe records.
+    last_eaten (dict): days since each recipe was last accepted, as returned by last_eaten_days.
+    average_last_eaten (float): value used for the recipes that were never accepted.
+    season_masks (dict): months in season of each recipe, as returned by Database.get_season_masks.
+
+    Returns:
+    tuple: (ids, X) the recipe ids and the float feature matrix.
+    """
+    ids = np.array([recipe.id for recipe in recipes], dtype=np.int64)
+    masks = np.array([season_masks.get(recipe.id, ALL_MONTHS) for recipe in recipes], dtype=np.int64)
+    in_season = (masks >> (datetime.now().month - 1)) & 1
+
+    X = np.array([[recipe.time_to_prepare, recipe.portions, recipe.preservation_days, recipe.can_be_frozen or 0,
+                   last_eaten.get(recipe.id, average_last_eaten),
+                   season,
+                   recipe.score] for recipe, season in zip(recipes, in_season.tolist())],
+                 dtype=float).reshape(-1, len(FEATURE_COLUMNS))
+    return ids, X
+
+
+def scoring_feature_matrix(scoring):
+    """
+    Assembles the feature matrix of the whole catalog, with the columns in FEATURE_COLUMNS, from the columns returned
+    by Database.get_scoring_columns.
+
+    Returns:
+    tuple: (ids, X) the recipe ids and the float feature matrix.
+    """
+    last_eaten = today_day() - scoring['last_accepted_day']
+    accepted = ~np.isnan(last_eaten)
+    # The recipes never accepted get the average time, as replace_none_values_with_average did
+    average_last_eaten = last_eaten[accepted].mean() if accepted.any() else 0
+    masks = np.where(np.isnan(scoring['season_mask']), ALL_MONTHS, scoring['season_mask']).astype(np.int64)
+
+    X = np.column_stack((scoring['time_to_prepare'], scoring['portions'], scoring['preservation_days'],
+                         np.nan_to_num(scoring['can_be_frozen']),
+                         np.where(accepted, last_eaten, average_last_eaten),
+                         (masks >> (datetime.now().month - 1)) & 1,
+                         scoring['score'])).astype(float)
+    return scoring['id'], X
+
+
+def iter_prediction_batches(db, model, chunk_size=1000):
+    """
+    Streams the probability of every recipe of being accepted, reading and scoring the recipes chunk by chunk so
+    that the memory used does not depend on the size of the catalog.
+
+    Parameters:
+    model: a trained classifier exposing predict_proba.
+    chunk_size (int): number of recipes scored with each call to the model.
+
+    Yields:
+    list: a batch of (recipe_id, probability) tuples.
+    """
+    last_eaten = last_eaten_days(db)
+    # The recipes never proposed get the average time, as replace_none_values_with_average did
+    average_last_eaten = sum(last_eaten.values()) / len(last_eaten) if len(last_eaten) > 0 else 0
+    season_masks = db.get_season_masks()
+
+    for recipes in db.iter_recipes(chunk_size):
+        ids, X = recipe_feature_matrix(recipes, last_eaten, average_last_eaten, season_masks)
+        probabilities = model.predict_proba(X)[:, 1]
+        yield list(zip(ids.tolist(), probabilities.tolist()))
+
+
+@profiled('predict')
 def create_predicion_list(db, model):
-    all_recipes = db.get_all_recipes()
-
-    # Transform it into a dictionary for easier access
-    # Assuming the structure of each recipe is as follows:
-    # (id, name, type, time_to_prepare, portions, preservation_days, can_be_frozen, score)
-    recipes_dict = {recipe[0]: {"recipe_id": recipe[0], "name": recipe[1], "type": recipe[2], "time_to_prepare": recipe[3],
-                    "portions": recipe[4], "preservation_days": recipe[5],
-                    "can_be_frozen": recipe[6], "score": recipe[7]} for recipe in all_recipes}
-
-    # Get the meal history
-    meal_history = db.get_meal_history()
-    # Sort meal history by date
-    meal_history.sort(key=lambda x: datetime.strptime(x['date'], '%Y-%m-%d'), reverse=True)
-
-    # Calculate time from last eaten
-    current_date = datetime.now()
-
-    # Initialize the dataset
-    dataset = []
-
-    for recipe_id in recipes_dict:
-        recipe = recipes_dict[recipe_id]
-        time_from_last_eaten = None
-        for meal in meal_history:
-            if meal['recipe_id'] == recipe['recipe_id']:
-                time_from_last_eaten = (current_date - datetime.strptime(meal['date'], '%Y-%m-%d')).days
-                break
-        in_season = check_season(db, recipe['recipe_id'])
-        data_row = {
-            'recipe_id': recipe["recipe_id"],
-            'time_to_prepare': recipe['time_to_prepare'],
-            'portions': recipe['portions'],
-            'preservation_days': recipe['preservation_days'],
-            'can_be_frozen': recipe['can_be_frozen'],
-            'time_from_last_eaten': time_from_last_eaten,
-            'score': meal['score'],
-            'in_season': in_season
-        }
-
-        # Add the data row to the dataset
-        dataset.append(data_row)
-
-    dataset = replace_none_values_with_average(dataset)
-    list_predictions = []
-    for entry in dataset:
-        X = [entry['time_to_prepare'], entry['portions'], entry['preservation_days'], entry['can_be_frozen'],
-             entry['time_from_last_eaten'], entry['in_season'], entry['score']]
-        probabilities = model.predict_proba([X])
-        element = {
-            "id": entry['recipe_id'],
-            "probability": probabilities[0][1]}
-        list_predictions.append(element)
-
-    print(dataset)
-    print(list_predictions)
-
-    return list_predictions
+    """
+    Scores the whole catalog with a single call to the model, reading the features of every recipe from the recipes
+    and recipe_features tables in a single scan.
 
-def train_logistic_regression(dataset, db):
-    # Convert the dataset into features and labels
-    X = [[entry['time_to_prepare'], entry['portions'], entry['preservation_days'], entry['can_be_frozen'],
-          entry['time_from_last_eaten'], entry['in_season'], entry['score']] for entry in dataset]
-    y = [entry['accepted'] for entry in dataset]
+    Returns:
+    list: a list of dictionaries {"id": recipe id, "probability": probability of the recipe being accepted}.
+    """
+    ids, X = scoring_feature_matrix(db.get_scoring_columns())
+    if len(ids) == 0:
+        return []
+    probabilities = model.predict_proba(X)[:, 1]
 
-    # Split the dataset into a training set and a test set
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.01, random_state=42)
+    return [{"id": recipe_id, "probability": probability}
+            for recipe_id, probability in zip(ids.tolist(), probabilities.tolist())]
 
-    # Create a Logistic Regression model and train it on the training set
+
+@profiled('train')
+def fit_model(dataset):
+    """
+    Trains the Logistic Regression model on the whole dataset.
+    sklearn is imported here, and by the unpickling of a stored model, so the menu options that do not train or score
+    start without loading it.
+    """
+    from sklearn.linear_model import LogisticRegression
+
+    X, y = dataset
     model = LogisticRegression()
-    model.fit(X_train, y_train)
+    model.fit(X, y)
+    return model
+
+
+def train_logistic_regression(dataset, db):
+    # Train the model and use it to make probability predictions on all the recipes
+    return create_predicion_list(db, fit_model(dataset))
+
+
+def get_model(db, retrain=False, include_archive=False):
+    """
+    Returns the prediction model of the database. The model stored next to the database is reused as long as no
+    recipe or meal history entry changed since it was trained, otherwise a new model is trained and stored.
 
-    # Use the model to make probability predictions on the test set
-    return create_predicion_list(db, model)
+    Parameters:
+    retrain (bool): train a new model even if the stored one is up to date.
+    include_archive (bool): train on the archived meal history as well, the model is stored separately.
+    """
+    store = ModelStore(db, 'model_archive' if include_archive else 'model')
+    model = None if retrain else store.load()
+    if model is None:
+        model = fit_model(create_dataset(db, include_archive))
+        store.save(model)
+    return model
 
 
 def print_menu():
@@ -331,15 +450,33 @@ def print_menu():
     print("15. View freezer")
     print("16. Print weekly plan")
     print("17. Create weekly plan")
+    print("18. Retrain the prediction model")
+    print("19. Fill the weekly plan automatically")
+    print("20. Switch to another household")
     print("16. Exit")
 
 
 def main():
-    # Get the database name from the user
-    db_name = input("Enter the name of the database: ")
-
-    # Create a Database object
-    db = Database(db_name + '.db')
+    db = None
+    while db is None:
+        # Get the database name from the user
+        db_name = input("Enter the name of the database: ")
+
+        # Every household has its own database, the other households are looked for in the same directory
+        shards = ShardManager(os.path.dirname(os.path.abspath(db_name + '.db')), max_open=4, cache_size=1024)
+        try:
+            db = shards.open(os.path.basename(db_name))
+        except sqlite3.DatabaseError as e:
+            print(e)
+
+    # MEALPLANNER_PROFILE=full measures every stage of the pipeline, a number between 0 and 1 only that fraction of
+    # the stage runs, without memory tracing and query counting
+    profile = os.environ.get('MEALPLANNER_PROFILE')
+    if profile == 'full':
+        set_profiler(StageProfiler(db, callback=print_stage))
+    elif profile:
+        set_profiler(StageProfiler(sample_rate=float(profile), trace_memory=False, count_queries=False,
+                                   callback=print_stage))
 
     while True:
         print_menu()
@@ -349,8 +486,10 @@ def main():
             name = input("Enter the name of the ingredient: ")
             type = input("Enter the type of the ingredient\n(berween 'beef', 'pork', 'chicken', 'fish', 'vegetables', "
                          "'animal origin', 'legumes', 'cerial', 'fruit', 'other'): ")
-            seasonality_start = input("Enter the seasonality of the ingredient: ")
-            seasonality_end = input("Enter the seasonality of the ingredient: ")
+            seasonality_start = input_month("Enter the first month of the season of the ingredient (1-12, empty for "
+                                            "all year): ")
+            seasonality_end = input_month("Enter the last month of the season of the ingredient (1-12, empty for "
+                                          "all year): ")
             contains_gluten = int(input("Does the ingredient contain gluten? Enter 1 for yes, 0 for no: "))
             db.add_ingredient((name, type, seasonality_start, seasonality_end, contains_gluten))
         elif choice == '2':
@@ -388,10 +527,29 @@ def main():
         elif choice == '16':
             db.print_weekly_meal_plan()
         elif choice == '17':
-            dataset = create_dataset(db)
-            list_of_predictions = train_logistic_regression(dataset, db)
+            list_of_predictions = create_predicion_list(db, get_model(db))
             planner = Meals_plan_creator(db, list_of_predictions)
             planner.single_meal()
+        elif choice == '18':
+            get_model(db, retrain=True)
+            print("The prediction model has been retrained.")
+        elif choice == '19':
+            list_of_predictions = create_predicion_list(db, get_model(db))
+            WeeklyPlanSolver(db, list_of_predictions).plan_week()
+            db.print_weekly_meal_plan()
+        elif choice == '20':
+            print("Households:", ", ".join(shards.households()))
+            household = input("Enter the name of the household: ")
+            # stays on the current household if the other one does not exist or cannot be opened
+            if not os.path.exists(shards.path(household)):
+                print(f"The household {household} does not exist.")
+            else:
+                try:
+                    db = shards.open(household)
+                except sqlite3.DatabaseError as e:
+                    print(e)
+            if get_profiler() is not None:
+                get_profiler().attach(db)
 
 
         # create_temporary_meal_plan(db)
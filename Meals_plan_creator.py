@@ -1,12 +1,21 @@
-from datetime import date
-from datetime import datetime
+from CandidateRanking import CandidateRanking
+from DietaryFilter import DietaryFilter
+from PantryCoverage import PANTRY_WEIGHT, PantryCoverage
+from Profiling import profiled
+from RecipeCatalog import RecipeCatalog
+from Recommender import record_feedback
 
 
 class Meals_plan_creator:
 
-    def __init__(self, db, prediction_list):
+    def __init__(self, db, prediction_list, catalog=None, pantry_weight=PANTRY_WEIGHT):
         self.db = db
         self.predictions = prediction_list.copy()
+        # snapshot of the recipes used to avoid querying the database for every suggestion
+        self.catalog = catalog if catalog is not None else RecipeCatalog(db)
+        self.dietary_filter = DietaryFilter(db, self.catalog)
+        self.pantry = PantryCoverage(db, self.catalog)
+        self.pantry_weight = pantry_weight
 
     def is_participant_in_profiles(self, participant, profiles):
         for profile in profiles:
@@ -79,6 +88,7 @@ class Meals_plan_creator:
 
         return temp_meal_plan
 
+    @profiled('single_meal')
     def single_meal(self):
         """
         method that produces a single meal, it keeps offering options until the user accept one, it uses the list of
@@ -87,7 +97,6 @@ class Meals_plan_creator:
         """
         # Get all profiles
         profiles = self.db.get_all_profiles()
-        celiac = False
         profiles_string = ""
         participants = []
         if profiles is None:
@@ -124,96 +133,64 @@ class Meals_plan_creator:
             print("please reinsert the partecipants")
             return self.single_meal()
 
-        "checks if any participant has celiac disease"
-        for participant in participants_info:
-            if participant is None:
-                participants_info.remove(participant)
-            elif participant[1] == 1:
-                celiac = True
-        # sorts the predictions dictionary based on the probability of each recipe to be chosen
-        sorted_predictions = sorted(self.predictions, key=lambda x: x['probability'], reverse=True)
-
-        # creates a list containing main dishes in order of probability, main dishes are both main and single dishes
-        main_dishes = []
-        sides = []
-
-        # removes all the dishes that contain gluten in case a celiac is participating to the meal. At the same time fills
-        # the list of main dishes and the list of sides
-        for recipe in sorted_predictions:
-            removed = False
-            ingredients = self.db.get_recipe_ingredients(recipe["id"])
-            if celiac:
-                for ingredient in ingredients:
-                    if ingredient['contains_gluten'] == 1:
-                        sorted_predictions.remove(recipe)
-                        removed = True
-                        break
-            if removed == False:
-                recipe_info = self.db.get_recipe_by_id(recipe['id'])
-                if recipe_info[2] == 'main dish' or recipe_info[2] == 'single dish':
-                    main_dishes.append(recipe_info)
-                else:
-                    sides.append(recipe_info)
+        catalog = self.catalog.snapshot()
+
+        # removes all the dishes that contain gluten in case a celiac is participating to the meal and all the dishes
+        # containing an ingredient some participant is intolerant to
+        allowed_predictions = self.dietary_filter.filter(self.predictions, participants)
+
+        # favours the dishes whose ingredients are already in storage, and keeps only those if the user wants to cook
+        # with what is available
+        min_coverage = 0.0
+        if verified_input("Do you want only dishes you can cook with the storage? [y/n]") == 'y':
+            min_coverage = 1.0
+        allowed_predictions = self.pantry.rank(allowed_predictions, self.pantry_weight, min_coverage)
+
+        # main dishes (both main and single dishes) and sides are produced lazily in order of probability, so only the
+        # suggestions actually shown are ranked
+        ranking = CandidateRanking(allowed_predictions, catalog)
+        main_dishes = ranking.main_dishes()
+        sides = ranking.sides()
 
         # starts from the most likely to the less likely to ask if each main dish is accepted
         confirmed_dish = None
         for main_dish in main_dishes:
             if verified_input(f"the suggestion is {main_dish} is it ok? ") == 'y':
                 confirmed_dish = main_dish
-                self.update_database(main_dish[0], True)
+                self.update_database(main_dish.id, True)
                 break
             else:
-                self.update_database(main_dish[0], False)
+                self.update_database(main_dish.id, False)
 
         # if the accepted dish is a "main dish" it asks if the user wants sides if it is a single dis it doesn't
         confirmed_sides = []
-        if confirmed_dish[2] == 'main dish':
+        if confirmed_dish is not None and confirmed_dish.type == 'main dish':
             if verified_input("Do you want also sides?") == 'y':
                 for side_dish in sides:
-                    answer = verified_input(f"the suggestion is {side_dish[1]} is it ok?")
+                    answer = verified_input(f"the suggestion is {side_dish.name} is it ok?")
                     if answer == 'y':
                         confirmed_sides.append(side_dish)
-                        self.update_database(side_dish[0], True)
+                        self.update_database(side_dish.id, True)
                     else:
-                        self.update_database(side_dish[0], False)
+                        self.update_database(side_dish.id, False)
                         if verified_input('do you want other sides?') == 'n':
                             break
 
-        if len(sides) > 0:
-            print(f"The selected meal is composed by:\n Main Dish\n\n {confirmed_dish[1]}\n Sides\n")
+        if confirmed_dish is not None:
+            print(f"The selected meal is composed by:\n Main Dish\n\n {confirmed_dish.name}\n Sides\n")
 
             for side in confirmed_sides:
-                print(side[1])
+                print(side.name)
 
 
 
 
     def update_database(self, recipe_id, accepted):
-        recipe = self.db.get_recipe_by_id(recipe_id)
-
-        if accepted:
-            self.db.update_recipe_score(recipe_id, +1)
-            self.db.add_to_meal_history(recipe_id, date.today().strftime("%Y-%m-%d"), check_season(self.db, recipe_id), recipe[7], 1)
-        else:
-            self.db.update_recipe_score(recipe_id, -1)
-            self.db.add_to_meal_history(recipe_id, date.today().strftime("%Y-%m-%d"), check_season(self.db, recipe_id),
-                                        recipe[7], 0)
+        record_feedback(self.db, self.catalog, recipe_id, accepted)
         print(self.db.get_meal_history())
         return
 
 
-def check_season(db, recipe_id):
-    recipe_ingredients = db.get_recipe_ingredients(recipe_id)
-
-    current_month = datetime.now().month
-
-    for ingredient in recipe_ingredients:
-        if ingredient['seasonality_start'] >= current_month >= ingredient['seasonality_end']:
-            return 0
-
-    return 1
-
-
 def verified_input(question):
     """
     function that checks if the answer is 'y' or 'n' to avoid confusion and keep the data clean
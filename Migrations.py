@@ -0,0 +1,339 @@
+from sqlite3 import Error
+
+# SQL expression converting an ISO date text into the number of days since 1970-01-01
+EPOCH_DAY_SQL = "CAST(julianday({}) - 2440587.5 AS INTEGER)"
+
+
+def create_version_triggers(db, version_triggers):
+    """ Create the version counters and the triggers that bump them, given as (counter, table, operations)"""
+    for counter, table, operations in version_triggers:
+        db.conn.execute('INSERT OR IGNORE INTO data_versions(table_name, version) VALUES(?, 0)', (counter,))
+        for operation in operations:
+            trigger_name = f"{table}_{operation.lower()}_version"
+            if counter != table:
+                trigger_name = f"{table}_{operation.lower()}_{counter}_version"
+            db.conn.execute(f""" CREATE TRIGGER IF NOT EXISTS {trigger_name}
+                                   AFTER {operation} ON {table}
+                                   BEGIN
+                                       UPDATE data_versions SET version = version + 1
+                                       WHERE table_name = '{counter}';
+                                   END; """)
+
+
+def create_base_schema(db):
+    """ Create the tables, the version counters with their triggers and the season masks of the recipes"""
+    # Ingredients table
+    ingredients_table = """ CREATE TABLE IF NOT EXISTS ingredients (
+                                name text PRIMARY KEY,
+                                type text NOT NULL CHECK(type IN ('beef', 'pork', 'chicken', 'fish', 'vegetables', 'animal origin', 'legumes', 'cerial', 'fruit', 'other')),
+                                seasonality_start integer,
+                                seasonality_end integer,
+                                contains_gluten integer NOT NULL
+                            ); """
+
+    # Recipes table
+    # Note: Many-to-many relationship and quantities will be handled separately
+    recipes_table = """ CREATE TABLE IF NOT EXISTS recipes (
+                            id integer PRIMARY KEY,
+                            name text NOT NULL,
+                            type text NOT NULL CHECK(type IN ('single dish', 'main dish', 'side dish')),
+                            time_to_prepare integer NOT NULL,
+                            portions integer NOT NULL,
+                            preservation_days integer NOT NULL,
+                            can_be_frozen integer,
+                            score integer NOT NULL DEFAULT 0
+                        ); """
+
+    # Profiles table
+    # Note: Many-to-many relationship with intolerances will be handled separately
+    profiles_table = """ CREATE TABLE IF NOT EXISTS profiles (
+                            name text PRIMARY KEY,
+                            celiac integer NOT NULL
+                        ); """
+
+    # Recipe-Ingredients table (for many-to-many relationship and quantities)
+    recipe_ingredients_table = """ CREATE TABLE IF NOT EXISTS recipe_ingredients (
+                                                recipe_id integer,
+                                                ingredient_name text,
+                                                quantity integer,
+                                                PRIMARY KEY(recipe_id, ingredient_name),
+                                                FOREIGN KEY(recipe_id) REFERENCES recipes(id),
+                                                FOREIGN KEY(ingredient_name) REFERENCES ingredients(name)
+                                            ); """
+
+    # Profile-Intolerances table (for many-to-many relationship)
+    profile_intolerances_table = """ CREATE TABLE IF NOT EXISTS profile_intolerances (
+                                                profile_name text,
+                                                ingredient_name text,
+                                                PRIMARY KEY(profile_name, ingredient_name),
+                                                FOREIGN KEY(profile_name) REFERENCES profiles(name),
+                                                FOREIGN KEY(ingredient_name) REFERENCES ingredients(name)
+                                            ); """
+    # Storage table
+    storage_table = """ CREATE TABLE IF NOT EXISTS storage (
+                            ingredient_name text PRIMARY KEY,
+                            quantity integer NOT NULL,
+                            FOREIGN KEY(ingredient_name) REFERENCES ingredients(name)
+                        ); """
+
+    # Fridge table
+    fridge_table = """ CREATE TABLE IF NOT EXISTS fridge (
+                            recipe_id integer PRIMARY KEY,
+                            portions integer NOT NULL,
+                            FOREIGN KEY(recipe_id) REFERENCES recipes(id)
+                        ); """
+    # Freezer table
+    freezer_table = """ CREATE TABLE IF NOT EXISTS freezer (
+                            recipe_id integer PRIMARY KEY,
+                            portions integer NOT NULL,
+                            FOREIGN KEY(recipe_id) REFERENCES recipes(id)
+                        ); """
+
+    weekly_meal_plan_table = """ CREATE TABLE IF NOT EXISTS weekly_meal_plan (
+                                    meal_id text PRIMARY KEY,
+                                    day text NOT NULL CHECK(day IN ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')),
+                                    meal text NOT NULL CHECK(meal IN ('lunch', 'dinner')),
+                                    location text NOT NULL CHECK(location IN ('home', 'work')),
+                                    recipe_id integer,
+                                    FOREIGN KEY(recipe_id) REFERENCES recipes(id)
+                                ); """
+    meal_profiles_table = """ CREATE TABLE IF NOT EXISTS meal_profiles (
+                                meal_id text,
+                                profile_name text,
+                                PRIMARY KEY(meal_id, profile_name),
+                                FOREIGN KEY(meal_id) REFERENCES weekly_meal_plan(meal_id),
+                                FOREIGN KEY(profile_name) REFERENCES profiles(name)
+                            ); """
+    meal_history_table = """ CREATE TABLE IF NOT EXISTS meal_history (
+                                id integer PRIMARY KEY,
+                                recipe_id integer NOT NULL,
+                                date text NOT NULL,
+                                in_season integer NOT NULL,
+                                score integer NOT NULL,
+                                accepted integer NOT NULL,
+                                FOREIGN KEY(recipe_id) REFERENCES recipes(id)
+                            ); """
+    # Months in which each recipe is in season, maintained by the methods that change recipes and ingredients
+    recipe_seasons_table = """ CREATE TABLE IF NOT EXISTS recipe_seasons (
+                                recipe_id integer PRIMARY KEY,
+                                season_mask integer NOT NULL,
+                                FOREIGN KEY(recipe_id) REFERENCES recipes(id)
+                            ); """
+    # Version counters, bumped by triggers every time the content of a tracked table changes
+    data_versions_table = """ CREATE TABLE IF NOT EXISTS data_versions (
+                                table_name text PRIMARY KEY,
+                                version integer NOT NULL DEFAULT 0
+                            ); """
+
+    for table in [ingredients_table, recipes_table, profiles_table, recipe_ingredients_table,
+                  profile_intolerances_table, storage_table, fridge_table, freezer_table, weekly_meal_plan_table,
+                  meal_profiles_table, meal_history_table, recipe_seasons_table, data_versions_table]:
+        db.conn.execute(table)
+
+    # (counter, table whose changes bump it, operations that bump it)
+    version_triggers = [
+        ('recipes', 'recipes', ['INSERT', 'UPDATE', 'DELETE']),
+        ('meal_history', 'meal_history', ['INSERT', 'UPDATE', 'DELETE']),
+        # the recipes are only updated to change their score, which is not part of the catalog
+        ('catalog', 'recipes', ['INSERT', 'DELETE']),
+        ('catalog', 'ingredients', ['INSERT', 'UPDATE', 'DELETE']),
+        ('catalog', 'recipe_ingredients', ['INSERT', 'UPDATE', 'DELETE']),
+        ('profiles', 'profiles', ['INSERT', 'UPDATE', 'DELETE']),
+        ('profiles', 'profile_intolerances', ['INSERT', 'UPDATE', 'DELETE']),
+    ]
+    create_version_triggers(db, version_triggers)
+
+    # Computes the season of the recipes created before the masks were stored
+    cur = db.conn.cursor()
+    cur.execute('SELECT id FROM recipes WHERE id NOT IN (SELECT recipe_id FROM recipe_seasons)')
+    missing = [row[0] for row in cur.fetchall()]
+    if missing:
+        db.update_season_masks(missing)
+
+
+def add_lookup_indexes(db):
+    """ Create the indexes used by the lookups that are not on a primary key"""
+    db.conn.execute('CREATE INDEX IF NOT EXISTS meal_history_recipe_date ON meal_history(recipe_id, date)')
+    db.conn.execute('CREATE INDEX IF NOT EXISTS meal_history_date ON meal_history(date)')
+    db.conn.execute('CREATE INDEX IF NOT EXISTS recipe_ingredients_ingredient ON recipe_ingredients(ingredient_name)')
+    db.conn.execute('CREATE INDEX IF NOT EXISTS recipes_name ON recipes(name)')
+    db.conn.execute('CREATE INDEX IF NOT EXISTS meal_profiles_profile ON meal_profiles(profile_name)')
+
+
+def add_meal_history_day(db):
+    """ Store the date of the meal history as an integer number of days since 1970-01-01, next to the text date"""
+    db.conn.execute('ALTER TABLE meal_history ADD COLUMN day integer')
+    db.conn.execute(f"UPDATE meal_history SET day = {EPOCH_DAY_SQL.format('date')}")
+    # rows inserted with the text date only, e.g. from a CSV file, get their day as well
+    db.conn.execute(f""" CREATE TRIGGER IF NOT EXISTS meal_history_insert_day
+                         AFTER INSERT ON meal_history
+                         WHEN NEW.day IS NULL
+                         BEGIN
+                             UPDATE meal_history SET day = {EPOCH_DAY_SQL.format('NEW.date')} WHERE id = NEW.id;
+                         END; """)
+    db.conn.execute('CREATE INDEX IF NOT EXISTS meal_history_recipe_day ON meal_history(recipe_id, day)')
+
+
+def add_meal_history_archive(db):
+    """ Keep only the most recent entries in the meal history, moving the older ones to an append-only archive"""
+    settings_table = """ CREATE TABLE IF NOT EXISTS settings (
+                            name text PRIMARY KEY,
+                            value
+                        ); """
+    meal_history_archive_table = """ CREATE TABLE IF NOT EXISTS meal_history_archive (
+                                        id integer PRIMARY KEY,
+                                        history_id integer NOT NULL,
+                                        recipe_id integer NOT NULL,
+                                        date text NOT NULL,
+                                        day integer,
+                                        in_season integer NOT NULL,
+                                        score integer NOT NULL,
+                                        accepted integer NOT NULL
+                                    ); """
+    db.conn.execute(settings_table)
+    db.conn.execute(meal_history_archive_table)
+    db.conn.execute("INSERT OR IGNORE INTO settings(name, value) VALUES('meal_history_limit', 240)")
+
+    # Ring buffer on the ids: every insert moves out the entries more than meal_history_limit ids older than the new
+    # one, which is usually a single row found on the primary key. A NULL limit keeps the whole history.
+    limit = "(SELECT value FROM settings WHERE name = 'meal_history_limit')"
+    db.conn.execute(f""" CREATE TRIGGER IF NOT EXISTS meal_history_retention
+                         AFTER INSERT ON meal_history
+                         WHEN {limit} IS NOT NULL
+                         BEGIN
+                             INSERT INTO meal_history_archive(history_id, recipe_id, date, day, in_season, score, accepted)
+                             SELECT id, recipe_id, date, day, in_season, score, accepted FROM meal_history
+                             WHERE id <= NEW.id - {limit} ORDER BY id;
+                             DELETE FROM meal_history WHERE id <= NEW.id - {limit};
+                         END; """)
+    # Applies the limit to the existing history
+    db.trim_meal_history()
+
+
+def add_recipe_features(db):
+    """ Keep a summary of the meal history of every recipe, with its current score and season, for the predictions"""
+    recipe_features_table = """ CREATE TABLE IF NOT EXISTS recipe_features (
+                                    recipe_id integer PRIMARY KEY,
+                                    last_day integer,
+                                    last_accepted_day integer,
+                                    accepted_count integer NOT NULL DEFAULT 0,
+                                    rejected_count integer NOT NULL DEFAULT 0,
+                                    score integer,
+                                    season_mask integer
+                                ); """
+    db.conn.execute(recipe_features_table)
+
+    # The triggers update the row of a recipe in the statement that changes its history, score or season, so the
+    # summary is always committed together with the change. The entries moved to the archive stay counted.
+    # The row is created without a conflict clause, since the REPLACE statements of add_recipes and
+    # update_season_masks would turn an INSERT OR IGNORE in their triggers into a replace, losing the history.
+    create_row = """INSERT INTO recipe_features(recipe_id) SELECT {0}
+                    WHERE NOT EXISTS (SELECT 1 FROM recipe_features WHERE recipe_id = {0});"""
+    day = f"COALESCE(NEW.day, {EPOCH_DAY_SQL.format('NEW.date')})"
+    db.conn.execute(f""" CREATE TRIGGER IF NOT EXISTS meal_history_insert_features
+                         AFTER INSERT ON meal_history
+                         BEGIN
+                             {create_row.format('NEW.recipe_id')}
+                             UPDATE recipe_features SET
+                                 last_day = MAX(COALESCE(last_day, {day}), {day}),
+                                 last_accepted_day = CASE WHEN NEW.accepted = 1
+                                                          THEN MAX(COALESCE(last_accepted_day, {day}), {day})
+                                                          ELSE last_accepted_day END,
+                                 accepted_count = accepted_count + (NEW.accepted = 1),
+                                 rejected_count = rejected_count + (NEW.accepted != 1)
+                             WHERE recipe_id = NEW.recipe_id;
+                         END; """)
+    # add_recipes replaces the recipes, which only fires the insert trigger: the history of the recipe is kept
+    for operation in ['INSERT', 'UPDATE OF score']:
+        db.conn.execute(f""" CREATE TRIGGER IF NOT EXISTS recipes_{operation.split()[0].lower()}_features
+                             AFTER {operation} ON recipes
+                             BEGIN
+                                 {create_row.format('NEW.id')}
+                                 UPDATE recipe_features SET score = NEW.score WHERE recipe_id = NEW.id;
+                             END; """)
+    for operation in ['INSERT', 'UPDATE']:
+        db.conn.execute(f""" CREATE TRIGGER IF NOT EXISTS recipe_seasons_{operation.lower()}_features
+                             AFTER {operation} ON recipe_seasons
+                             BEGIN
+                                 {create_row.format('NEW.recipe_id')}
+                                 UPDATE recipe_features SET season_mask = NEW.season_mask
+                                 WHERE recipe_id = NEW.recipe_id;
+                             END; """)
+    # Summarizes the existing history
+    db.rebuild_recipe_features()
+
+
+def add_storage_version(db):
+    """ Track the changes of the storage, so that the pantry coverage of the recipes is only updated when it changes"""
+    create_version_triggers(db, [('storage', 'storage', ['INSERT', 'UPDATE', 'DELETE'])])
+
+
+def add_storage_changes(db):
+    """ Record the storage version at which each ingredient last changed, so that only the changed rows are read"""
+    storage_changes_table = """ CREATE TABLE IF NOT EXISTS storage_changes (
+                                    ingredient_name text PRIMARY KEY,
+                                    version integer NOT NULL
+                                ); """
+    db.conn.execute(storage_changes_table)
+    db.conn.execute('CREATE INDEX IF NOT EXISTS storage_changes_version ON storage_changes(version)')
+
+    # The triggers bump the version and record the change in the same body, so the recorded version is the one
+    # the change produced whatever the order in which the triggers of a statement fire. The row is written without
+    # a conflict clause, since the REPLACE statements of add_to_storage would override it.
+    version = "(SELECT version FROM data_versions WHERE table_name = 'storage')"
+    record_change = """UPDATE storage_changes SET version = {1} WHERE ingredient_name = {0};
+                       INSERT INTO storage_changes(ingredient_name, version) SELECT {0}, {1}
+                       WHERE NOT EXISTS (SELECT 1 FROM storage_changes WHERE ingredient_name = {0});"""
+    changed_rows = {'INSERT': ['NEW'], 'UPDATE': ['OLD', 'NEW'], 'DELETE': ['OLD']}
+    for operation, rows in changed_rows.items():
+        db.conn.execute(f'DROP TRIGGER IF EXISTS storage_{operation.lower()}_version')
+        records = ''.join(record_change.format(f'{row}.ingredient_name', version) for row in rows)
+        db.conn.execute(f""" CREATE TRIGGER IF NOT EXISTS storage_{operation.lower()}_changes
+                             AFTER {operation} ON storage
+                             BEGIN
+                                 UPDATE data_versions SET version = version + 1 WHERE table_name = 'storage';
+                                 {records}
+                             END; """)
+    # The rows already in storage count as changed at the current version
+    db.conn.execute(f"""INSERT INTO storage_changes(ingredient_name, version)
+                        SELECT ingredient_name, {version} FROM storage
+                        WHERE ingredient_name NOT IN (SELECT ingredient_name FROM storage_changes)""")
+
+
+# Migrations in order of application, the schema version of a database (PRAGMA user_version) is the number of
+# migrations already applied to it. New migrations are only ever appended.
+MIGRATIONS = [
+    create_base_schema,
+    add_lookup_indexes,
+    add_meal_history_day,
+    add_meal_history_archive,
+    add_recipe_features,
+    add_storage_version,
+    add_storage_changes,
+]
+
+
+def get_schema_version(db):
+    return db.conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db):
+    """
+    Bring the schema of the database to the latest version, applying the missing migrations in a single transaction.
+    On an up-to-date database it only reads the schema version.
+    """
+    if get_schema_version(db) >= len(MIGRATIONS):
+        return
+
+    try:
+        with db.batch():
+            # DDL statements do not open a transaction by themselves
+            if not db.conn.in_transaction:
+                db.conn.execute('BEGIN IMMEDIATE')
+            # read again inside the transaction, another connection may have migrated the database meanwhile
+            version = get_schema_version(db)
+            for number in range(version, len(MIGRATIONS)):
+                MIGRATIONS[number](db)
+                db.conn.execute(f'PRAGMA user_version = {number + 1}')
+    except Error as e:
+        print(e)
@@ -0,0 +1,59 @@
+import os
+import pickle
+
+
+class ModelStore:
+    """
+    Keeps the trained prediction model on disk, next to the SQLite file of the database.
+    The model is saved together with the version of the meal history and of the recipes it was trained on, so it can
+    be reused until the data changes.
+    """
+
+    def __init__(self, db, name='model'):
+        self.db = db
+        self.path = None
+        if db.db_file != ':memory:':
+            self.path = os.path.splitext(db.db_file)[0] + f'.{name}.pkl'
+
+    def load(self):
+        """
+        Loads the stored model if it was trained on the current version of the data.
+
+        Returns:
+        The model, or None if there is no model or it is out of date.
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return None
+
+        try:
+            with open(self.path, 'rb') as file:
+                stored = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            # AttributeError and ImportError come from a model saved with other versions of sklearn or NumPy: it is
+            # stale, a new one is trained and replaces it
+            print(f"Cannot read the stored model: {e}")
+            return None
+
+        if stored.get('version') != self.db.get_data_version():
+            return None
+        return stored.get('model')
+
+    def save(self, model):
+        """
+        Saves the model together with the current version of the data.
+        The file is replaced atomically, so a concurrent load never reads a partial model.
+        """
+        if self.path is None:
+            return
+
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump({'version': self.db.get_data_version(), 'model': model}, file)
+        os.replace(temporary_path, self.path)
+
+    def delete(self):
+        """
+        Deletes the stored model, forcing the next request to train a new one.
+        """
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
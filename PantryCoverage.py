@@ -0,0 +1,145 @@
+import numpy as np
+
+# Added to the probability of a recipe whose ingredients are all in storage, in proportion to its coverage
+PANTRY_WEIGHT = 0.2
+
+
+class PantryCoverage:
+    """
+    Computes, for every recipe of the catalog at once, the fraction of the quantity of its ingredients already in
+    storage, to favour the suggestions that can be cooked now or to keep only those.
+
+    The catalog is encoded as a sparse recipe x ingredient quantity matrix, one entry for each ingredient of each
+    recipe, grouped by ingredient. An ingredient counts up to the quantity the recipe needs, so the coverage of a
+    recipe is sum(min(stored, needed)) / sum(needed) over its ingredients; the recipes that need nothing are fully
+    covered. When the storage changes only the rows of the ingredients changed since the last load are read, from the
+    storage_changes log, and only their entries are updated, so changing one storage row costs O(recipes using that
+    ingredient).
+    """
+
+    def __init__(self, db, catalog):
+        self.db = db
+        self.catalog = catalog
+        self.catalog_version = None
+        self.storage_version = None
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.ingredient_index = {}
+        # entries of the quantity matrix sorted by ingredient, those of ingredient i are starts[i]:starts[i + 1]
+        self.starts = np.zeros(1, dtype=np.int64)
+        self.entry_recipes = np.zeros(0, dtype=np.int64)
+        self.entry_quantities = np.zeros(0, dtype=float)
+        # quantity needed by each recipe, quantity of each ingredient in storage, and quantity of each recipe covered
+        self.needed = np.zeros(0, dtype=float)
+        self.stored = np.zeros(0, dtype=float)
+        self.covered = np.zeros(0, dtype=float)
+        self.values = None
+
+    def _encode_catalog(self):
+        """
+        Encodes the recipes of the catalog as a quantity matrix, if the catalog changed since the last encoding.
+        """
+        catalog = self.catalog.snapshot()
+        if catalog.version == self.catalog_version:
+            return
+
+        self.recipe_ids = np.array(sorted(catalog.recipes), dtype=np.int64)
+        names = sorted({name for ingredients in catalog.quantities.values() for name in ingredients})
+        self.ingredient_index = {name: index for index, name in enumerate(names)}
+
+        recipe_quantities = [catalog.quantities[recipe_id] for recipe_id in self.recipe_ids.tolist()]
+        counts = np.array([len(quantities) for quantities in recipe_quantities], dtype=np.int64)
+        ingredients = np.array([self.ingredient_index[name] for quantities in recipe_quantities for name in quantities],
+                               dtype=np.int64)
+        quantities = np.array([quantity or 0 for quantities in recipe_quantities for quantity in quantities.values()],
+                              dtype=float)
+        order = np.argsort(ingredients, kind='stable')
+        ingredients = ingredients[order]
+        self.entry_recipes = np.repeat(np.arange(len(self.recipe_ids)), counts)[order]
+        self.entry_quantities = quantities[order]
+        self.starts = np.searchsorted(ingredients, np.arange(len(names) + 1))
+
+        self.needed = np.bincount(self.entry_recipes, weights=self.entry_quantities, minlength=len(self.recipe_ids))
+        self.stored = np.zeros(len(names), dtype=float)
+        self.covered = np.zeros(len(self.recipe_ids), dtype=float)
+        self.values = None
+
+        self.catalog_version = catalog.version
+        # the storage is applied again to the new matrix
+        self.storage_version = None
+
+    def _set_stored(self, index, quantity):
+        """
+        Changes the quantity in storage of an ingredient, updating the coverage of the recipes that use it.
+        """
+        entries = slice(self.starts[index], self.starts[index + 1])
+        needed = self.entry_quantities[entries]
+        delta = np.minimum(quantity, needed) - np.minimum(self.stored[index], needed)
+        # an ingredient appears at most once in a recipe, so the recipes of the slice are distinct
+        self.covered[self.entry_recipes[entries]] += delta
+        self.stored[index] = quantity
+
+    def _load_storage(self):
+        """
+        Applies the changes of the storage, if it changed since it was last loaded. Only the rows of the ingredients
+        changed since the loaded version are read, all of them after the catalog was encoded again.
+        """
+        version = self.db.get_storage_version()
+        if version == self.storage_version:
+            return
+
+        # a new matrix starts from an empty storage, every ingredient ever stored is applied to it
+        since = -1 if self.storage_version is None else self.storage_version
+        for name, quantity in self.db.get_storage_changes(since).items():
+            index = self.ingredient_index.get(name)
+            if index is None:
+                continue
+            quantity = max(quantity or 0, 0)
+            if quantity != self.stored[index]:
+                self._set_stored(index, quantity)
+                self.values = None
+        self.storage_version = version
+
+    def coverage(self):
+        """
+        Computes the coverage of every recipe of the catalog, updating it if the catalog or the storage changed.
+        The same array is returned as long as nothing changed.
+
+        Returns:
+        np.ndarray: fraction between 0 and 1 of the quantity needed by each recipe that is in storage, aligned with
+        self.recipe_ids.
+        """
+        self._encode_catalog()
+        self._load_storage()
+        if self.values is None:
+            values = np.ones(len(self.recipe_ids), dtype=float)
+            np.divide(self.covered, self.needed, out=values, where=self.needed > 0)
+            # the incremental sums can only be off by rounding
+            self.values = np.clip(values, 0.0, 1.0)
+        return self.values
+
+    def rank(self, predictions, weight=PANTRY_WEIGHT, min_coverage=0.0):
+        """
+        Adds the coverage of each recipe to its prediction, as a "coverage" and a "score" that favours the recipes
+        in storage, and drops the recipes with less than min_coverage, preserving the order of the predictions.
+
+        Parameters:
+        predictions (list): dictionaries with at least the recipe "id" and its "probability".
+        weight (float): added to the probability of a fully covered recipe to obtain its score.
+        min_coverage (float): coverage below which a recipe is dropped, 1 keeps only what can be cooked now.
+
+        Returns:
+        list: new dictionaries with the keys of the predictions, coverage and score.
+        """
+        coverage = self.coverage()
+        if len(predictions) == 0:
+            return []
+
+        ids = np.array([prediction['id'] for prediction in predictions], dtype=np.int64)
+        values = np.zeros(len(ids), dtype=float)
+        if len(self.recipe_ids) > 0:
+            position = np.minimum(np.searchsorted(self.recipe_ids, ids), len(self.recipe_ids) - 1)
+            known = self.recipe_ids[position] == ids
+            values[known] = coverage[position[known]]
+
+        return [dict(prediction, coverage=value, score=prediction['probability'] + weight * value)
+                for prediction, value in zip(predictions, values.tolist()) if value >= min_coverage]
@@ -0,0 +1,166 @@
+import functools
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Profiler receiving the stages of the pipeline, None when profiling is off
+_profiler = None
+
+
+def set_profiler(profiler):
+    """
+    Installs the profiler that receives the stages of the pipeline, None to turn profiling off.
+    """
+    global _profiler
+    _profiler = profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+@contextmanager
+def stage(name):
+    """
+    Marks a block of code as a stage of the pipeline, measured by the installed profiler if there is one.
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    with profiler.stage(name):
+        yield
+
+
+def profiled(name):
+    """
+    Decorator that makes every call of a function a stage of the pipeline.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class StageProfiler:
+    """
+    Measures the stages of the pipeline: wall time, CPU time of the process, number of SQL queries and peak of the
+    memory allocated by Python, relative to the start of the stage.
+
+    Full tracing (the defaults) measures every run of every stage, for benchmarks. In production, sample_rate
+    measures only a random fraction of the runs, and trace_memory=False and count_queries=False avoid the cost of
+    tracemalloc and of the SQL instrumentation.
+
+    The queries are counted with the instrumentation of the attached database (see Database.enable_instrumentation),
+    which counts the queries of all the threads. Nested stages are measured separately, the outer stage includes
+    the inner ones.
+    """
+
+    def __init__(self, db=None, sample_rate=1.0, trace_memory=True, count_queries=True, callback=None, seed=None):
+        self.sample_rate = sample_rate
+        self.trace_memory = trace_memory
+        self.count_queries = count_queries
+        self.callback = callback
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # stage name -> aggregated measures
+        self.stages = {}
+        self.db = None
+        self.attach(db)
+
+    def attach(self, db):
+        """
+        Counts the queries of a database from now on, e.g. after switching household.
+        """
+        self.db = db
+        if db is not None and self.count_queries and db.instrumentation is None:
+            db.enable_instrumentation()
+
+    def _queries(self):
+        instrumentation = self.db.instrumentation if self.db is not None else None
+        return instrumentation.queries if instrumentation is not None else None
+
+    @contextmanager
+    def stage(self, name):
+        with self.lock:
+            totals = self.stages.setdefault(name, {"runs": 0, "measured_runs": 0, "wall_seconds": 0.0,
+                                                   "cpu_seconds": 0.0, "queries": 0, "peak_memory_bytes": 0})
+            totals["runs"] += 1
+            measured = self.sample_rate >= 1 or self.random.random() < self.sample_rate
+        if not measured:
+            yield
+            return
+
+        # stack of the memory frames of the stages open in this thread: [traced memory at start, peak so far]
+        frames = self.local.__dict__.setdefault('frames', [])
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            current, peak = tracemalloc.get_traced_memory()
+            if frames:
+                frames[-1][1] = max(frames[-1][1], peak)
+            tracemalloc.reset_peak()
+            frames.append([current, current])
+
+        queries = self._queries()
+        cpu = time.process_time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            measures = {"wall_seconds": time.perf_counter() - start, "cpu_seconds": time.process_time() - cpu,
+                        "queries": None, "peak_memory_bytes": None}
+            if queries is not None and self._queries() is not None:
+                measures["queries"] = self._queries() - queries
+            if self.trace_memory:
+                base, peak = frames.pop()
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                measures["peak_memory_bytes"] = peak - base
+                if frames:
+                    # the memory of the inner stage is part of the outer one
+                    frames[-1][1] = max(frames[-1][1], peak)
+                if started_tracing:
+                    tracemalloc.stop()
+
+            with self.lock:
+                totals["measured_runs"] += 1
+                totals["wall_seconds"] += measures["wall_seconds"]
+                totals["cpu_seconds"] += measures["cpu_seconds"]
+                totals["queries"] += measures["queries"] or 0
+                totals["peak_memory_bytes"] = max(totals["peak_memory_bytes"], measures["peak_memory_bytes"] or 0)
+            if self.callback is not None:
+                self.callback(name, measures)
+
+    def report(self):
+        """
+        Returns the measures of every stage: runs, measured runs, total wall and CPU seconds and queries of the
+        measured runs, and the highest memory peak.
+        """
+        with self.lock:
+            return {name: dict(totals) for name, totals in self.stages.items()}
+
+    def print_report(self):
+        print(f"{'stage':<25} {'runs':>6} {'measured':>9} {'wall s':>10} {'cpu s':>10} {'queries':>8} {'peak MiB':>9}")
+        for name, totals in self.report().items():
+            print(f"{name:<25} {totals['runs']:>6} {totals['measured_runs']:>9} {totals['wall_seconds']:>10.4f} "
+                  f"{totals['cpu_seconds']:>10.4f} {totals['queries']:>8} {totals['peak_memory_bytes'] / 2 ** 20:>9.2f}")
+
+
+def print_stage(name, measures):
+    """
+    Callback of the StageProfiler that prints the measures of every stage run.
+    """
+    peak = measures["peak_memory_bytes"]
+    print(f"[profile] {name}: {measures['wall_seconds']:.4f} s wall, {measures['cpu_seconds']:.4f} s cpu, "
+          f"{measures['queries'] if measures['queries'] is not None else '-'} queries, "
+          f"{f'{peak / 2 ** 20:.2f} MiB peak' if peak is not None else '-'}")
@@ -0,0 +1,130 @@
+import copy
+import functools
+import threading
+from collections import OrderedDict
+
+
+def integer_key(value):
+    """
+    Normalizes an id given either as a number or as text, e.g. from input(), since SQLite treats them the same.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def cache_key(method, args):
+    """
+    Key of the result of a cached Database method called with some arguments.
+    """
+    normalize = getattr(method, 'normalize', None)
+    if normalize is not None:
+        args = tuple(normalize(arg) for arg in args)
+    return (method.__name__,) + tuple(args)
+
+
+def cached(normalize=None):
+    """
+    Decorator of the Database point lookups whose results can be kept in the read cache of the database.
+
+    The cache is skipped while the thread has uncommitted changes, so that they are never seen by the other threads
+    and never survive a rollback.
+
+    Parameters:
+    normalize (function): applied to every argument to build the key, e.g. integer_key.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            cache = self.cache
+            if cache is None or self.batch_depth > 0 or self.conn.in_transaction:
+                return method(self, *args)
+            return cache.get(cache_key(wrapper, args), lambda: method(self, *args))
+
+        wrapper.normalize = normalize
+        return wrapper
+
+    return decorator
+
+
+class ReadCache:
+    """
+    Bounded LRU cache of the results of the Database point lookups, such as get_recipe_by_id.
+
+    Entries are removed by the Database methods that change the rows they were read from, so the cache only knows
+    about the changes made through the same Database object. Lists and dictionaries are copied when returned, so
+    the callers cannot change the cached values.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # bumped by every invalidation, a value read before an invalidation is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, load):
+        """
+        Returns the cached value of a key, calling load() and storing its result if it is not cached.
+        None results, i.e. missing rows or errors, are not stored.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self._copy(self.entries[key])
+            self.misses += 1
+            generation = self.generation
+
+        value = load()
+
+        with self.lock:
+            if value is not None and generation == self.generation:
+                self.entries[key] = value
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return self._copy(value)
+
+    @staticmethod
+    def _copy(value):
+        if isinstance(value, (list, dict)):
+            return copy.deepcopy(value)
+        return value
+
+    def invalidate(self, keys):
+        """
+        Removes the entries of some keys.
+        """
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes all the entries, e.g. after a bulk import.
+        """
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Returns the size of the cache and its hit, miss and eviction counters.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,77 @@
+from Seasonality import ALL_MONTHS, is_in_season
+
+
+class RecipeCatalog:
+    """
+    In-memory snapshot of the recipes, of their ingredients with their quantities and of their seasons, loaded with
+    three bulk queries.
+
+    The snapshot remembers the catalog version of the database it was loaded from and reloads itself when the
+    version changes, that is after add_recipe, delete_recipe, add_ingredient or delete_ingredient.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.version = None
+        self.recipes = {}
+        self.types = {}
+        self.contains_gluten = {}
+        self.ingredients = {}
+        self.quantities = {}
+        self.season_masks = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+        Reloads the whole catalog from the database.
+        """
+        self.version = self.db.get_catalog_version()
+
+        all_recipes = self.db.get_all_recipes() or []
+        self.recipes = {recipe.id: recipe for recipe in all_recipes}
+        self.types = {recipe.id: recipe.type for recipe in all_recipes}
+
+        ingredients = {recipe_id: set() for recipe_id in self.recipes}
+        quantities = {recipe_id: {} for recipe_id in self.recipes}
+        gluten = {recipe_id: False for recipe_id in self.recipes}
+        for recipe_id, name, quantity, type_, seasonality_start, seasonality_end, contains_gluten in \
+                self.db.get_all_recipe_ingredients() or []:
+            if recipe_id not in self.recipes:
+                continue
+            ingredients[recipe_id].add(name)
+            quantities[recipe_id][name] = quantity
+            if contains_gluten == 1:
+                gluten[recipe_id] = True
+
+        self.ingredients = {recipe_id: frozenset(names) for recipe_id, names in ingredients.items()}
+        self.quantities = quantities
+        self.contains_gluten = gluten
+        self.season_masks = self.db.get_season_masks()
+
+    def snapshot(self):
+        """
+        Makes sure the catalog reflects the database, reloading it only if the catalog version changed.
+        It costs a single query when nothing changed.
+
+        Returns:
+        RecipeCatalog: the catalog itself, up to date.
+        """
+        if self.db.get_catalog_version() != self.version:
+            self.refresh()
+        return self
+
+    def get(self, recipe_id):
+        """
+        Returns the recipe tuple (id, name, type, time_to_prepare, portions, preservation_days, can_be_frozen, score)
+        as it was when the catalog was loaded, or None if the recipe does not exist.
+        """
+        return self.recipes.get(recipe_id)
+
+    def in_season(self, recipe_id, month=None):
+        """
+        Checks if all the ingredients of the recipe are in season, in the current month by default.
+
+        Returns:
+        int: 1 if the recipe is in season, 0 otherwise.
+        """
+        return is_in_season(self.season_masks.get(recipe_id, ALL_MONTHS), month)
@@ -0,0 +1,113 @@
+from datetime import date
+
+import numpy as np
+
+from CandidateRanking import MAIN_TYPES
+from DietaryFilter import DietaryFilter
+from PantryCoverage import PantryCoverage
+from RecipeCatalog import RecipeCatalog
+
+
+def record_feedback(db, catalog, recipe_id, accepted):
+    """
+    Records if a suggested recipe was accepted: updates its score and adds the suggestion to the meal history.
+
+    Parameters:
+    catalog (RecipeCatalog): catalog used to know if the recipe is in season.
+    recipe_id (int): the ID of the suggested recipe.
+    accepted (bool): True if the recipe was accepted.
+    """
+    recipe = db.get_recipe_by_id(recipe_id)
+    if recipe is None:
+        return
+
+    in_season = catalog.in_season(recipe_id)
+    db.update_recipe_score(recipe_id, +1 if accepted else -1)
+    db.add_to_meal_history(recipe_id, date.today().strftime("%Y-%m-%d"), in_season, recipe.score, 1 if accepted else 0)
+
+
+class Recommender:
+    """
+    Programmatic access to the suggestions, without any terminal input or output.
+
+    The profiles, the catalog and the compiled dietary masks are kept in memory and only reloaded when the database
+    changes, and the ranking of every group of participants is computed once, so a call to recommend costs two
+    version checks plus O(k).
+    """
+
+    def __init__(self, db, prediction_list, catalog=None):
+        self.db = db
+        self.catalog = catalog if catalog is not None else RecipeCatalog(db)
+        self.dietary_filter = DietaryFilter(db, self.catalog)
+        self.pantry = PantryCoverage(db, self.catalog)
+        self.probabilities = {prediction['id']: prediction['probability'] for prediction in prediction_list}
+        # (participants, meal type, pantry weight, min coverage) -> (allowed mask and coverage the ranking was computed
+        # with, ranked recipe positions)
+        self.rankings = {}
+        self.recipe_ids = None
+
+    def _ranking(self, participants, main, pantry_weight=0.0, min_coverage=0.0):
+        allowed = self.dietary_filter.compile(participants)
+        # the coverage is only computed, and only invalidates the rankings, when it is used
+        coverage = self.pantry.coverage() if pantry_weight != 0 or min_coverage > 0 else None
+        key = (frozenset(participant.lower() for participant in participants), main, pantry_weight, min_coverage)
+
+        cached = self.rankings.get(key)
+        if cached is not None and cached[0] is allowed and cached[1] is coverage:
+            return cached[2]
+
+        recipe_ids = self.dietary_filter.recipe_ids
+        if self.recipe_ids is not recipe_ids:
+            # the catalog changed: the arrays aligned with the recipes are rebuilt
+            catalog = self.catalog.snapshot()
+            self.recipe_ids = recipe_ids
+            self.scores = np.array([self.probabilities.get(recipe_id, 0.0) for recipe_id in recipe_ids.tolist()])
+            self.is_main = np.array([catalog.types[recipe_id] in MAIN_TYPES for recipe_id in recipe_ids.tolist()],
+                                    dtype=bool)
+            self.rankings = {}
+
+        eligible = allowed & (self.is_main if main else ~self.is_main)
+        scores = self.scores
+        if coverage is not None:
+            eligible &= coverage >= min_coverage
+            scores = scores + pantry_weight * coverage
+        eligible = np.flatnonzero(eligible)
+        ranked = eligible[np.argsort(-scores[eligible], kind='stable')]
+        self.rankings[key] = (allowed, coverage, ranked)
+        return ranked
+
+    def recommend(self, participants, meal_type='main', k=5, pantry_weight=0.0, min_coverage=0.0):
+        """
+        Returns the k most likely recipes that all the participants can eat.
+
+        Parameters:
+        participants (list): names of the profiles taking part in the meal.
+        meal_type (str): 'main' for main and single dishes, 'side' for side dishes.
+        k (int): maximum number of recipes returned.
+        pantry_weight (float): added to the probability of the recipes in proportion to their coverage by the
+        storage (see PantryCoverage), to rank first what can be cooked now.
+        min_coverage (float): fraction of the quantity of its ingredients that a recipe needs in storage to be
+        recommended, 1 to recommend only what can be cooked now.
+
+        Returns:
+        list: dictionaries with id, name, type, probability and coverage of each recipe, from the best ranked.
+        """
+        if meal_type not in ['main', 'side']:
+            raise ValueError("meal_type should be 'main' or 'side'")
+
+        ranked = self._ranking(participants, meal_type == 'main', pantry_weight, min_coverage)[:k]
+        coverage = self.pantry.values if pantry_weight != 0 or min_coverage > 0 else None
+
+        recommendations = []
+        for position in ranked.tolist():
+            recipe = self.catalog.get(int(self.recipe_ids[position]))
+            recommendations.append({"id": recipe.id, "name": recipe.name, "type": recipe.type,
+                                    "probability": float(self.scores[position]),
+                                    "coverage": float(coverage[position]) if coverage is not None else None})
+        return recommendations
+
+    def record_feedback(self, recipe_id, accepted):
+        """
+        Records if a recommended recipe was accepted, updating its score and the meal history.
+        """
+        record_feedback(self.db, self.catalog, recipe_id, accepted)
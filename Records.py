@@ -0,0 +1,46 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Rows returned by the Database, with the fields in the column order of their table. They are tuples, so the code
+# indexing them keeps working, and they have no per-instance dictionary, so they take as much memory as a plain tuple.
+Recipe = namedtuple('Recipe', ['id', 'name', 'type', 'time_to_prepare', 'portions', 'preservation_days',
+                               'can_be_frozen', 'score'])
+Ingredient = namedtuple('Ingredient', ['name', 'type', 'seasonality_start', 'seasonality_end', 'contains_gluten'])
+Profile = namedtuple('Profile', ['name', 'celiac'])
+MealHistoryEntry = namedtuple('MealHistoryEntry', ['id', 'recipe_id', 'date', 'in_season', 'score', 'accepted',
+                                                   'day'])
+StoredPortions = namedtuple('StoredPortions', ['recipe_id', 'portions'])
+RecipeFeatures = namedtuple('RecipeFeatures', ['recipe_id', 'last_day', 'last_accepted_day', 'accepted_count',
+                                               'rejected_count', 'score', 'season_mask'])
+
+
+def row_factory(record):
+    """
+    Returns a sqlite3 row factory that builds records of the given type directly from the fetched rows.
+    """
+    def make(cursor, row):
+        return record(*row)
+
+    return make
+
+
+def columns(record):
+    """
+    Returns the fields of a record type as the column list of a SELECT statement.
+    """
+    return ', '.join(record._fields)
+
+
+# NumPy types of the columns returned by the columnar fetch methods of the Database. The integer columns that can be
+# NULL are floats, so that a missing value is NaN.
+RECIPE_DTYPES = {'id': np.int64, 'name': object, 'type': object, 'time_to_prepare': np.int64, 'portions': np.int64,
+                 'preservation_days': np.int64, 'can_be_frozen': float, 'score': np.int64}
+INGREDIENT_DTYPES = {'name': object, 'type': object, 'seasonality_start': float, 'seasonality_end': float,
+                     'contains_gluten': np.int64}
+MEAL_HISTORY_DTYPES = {'id': np.int64, 'recipe_id': np.int64, 'date': object, 'in_season': np.int64,
+                       'score': np.int64, 'accepted': np.int64, 'day': np.int64}
+# Columns of the recipes needed to score them, from the recipes and recipe_features tables
+SCORING_DTYPES = {'id': np.int64, 'time_to_prepare': np.int64, 'portions': np.int64, 'preservation_days': np.int64,
+                  'can_be_frozen': float, 'last_day': float, 'last_accepted_day': float, 'accepted_count': np.int64,
+                  'rejected_count': np.int64, 'score': np.int64, 'season_mask': float}
@@ -0,0 +1,68 @@
+from datetime import datetime
+
+# Mask with the bit of every month set, bit 0 is January and bit 11 is December
+ALL_MONTHS = 0xFFF
+
+
+def ingredient_season_mask(seasonality_start, seasonality_end):
+    """
+    Computes the 12-month mask of the months in which an ingredient is in season.
+    The range includes both ends and can wrap across the end of the year (e.g. from 11 to 2).
+    An ingredient without seasonality, or with months that are not numbers from 1 to 12 (e.g. blank text entered
+    in the menu), is in season all year long.
+
+    Parameters:
+    seasonality_start (int): first month of the season, from 1 to 12.
+    seasonality_end (int): last month of the season, from 1 to 12.
+
+    Returns:
+    int: the mask of the months in season.
+    """
+    if seasonality_start is None or seasonality_end is None:
+        return ALL_MONTHS
+
+    try:
+        start = int(seasonality_start)
+        end = int(seasonality_end)
+    except (TypeError, ValueError):
+        return ALL_MONTHS
+    if not (1 <= start <= 12 and 1 <= end <= 12):
+        return ALL_MONTHS
+
+    if start <= end:
+        months = range(start, end + 1)
+    else:
+        months = list(range(start, 13)) + list(range(1, end + 1))
+
+    mask = 0
+    for month in months:
+        mask |= 1 << (month - 1)
+    return mask
+
+
+def recipe_season_mask(seasons):
+    """
+    Computes the mask of the months in which all the ingredients of a recipe are in season.
+
+    Parameters:
+    seasons (list): (seasonality_start, seasonality_end) of every ingredient of the recipe.
+
+    Returns:
+    int: the mask of the months in season.
+    """
+    mask = ALL_MONTHS
+    for seasonality_start, seasonality_end in seasons:
+        mask &= ingredient_season_mask(seasonality_start, seasonality_end)
+    return mask
+
+
+def is_in_season(mask, month=None):
+    """
+    Checks a season mask for a month, the current month by default.
+
+    Returns:
+    int: 1 if the month is in the mask, 0 otherwise.
+    """
+    if month is None:
+        month = datetime.now().month
+    return (mask >> (month - 1)) & 1
@@ -0,0 +1,221 @@
+import argparse
+import glob
+import os
+import sqlite3
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from Database import Database
+from ModelStore import ModelStore
+
+
+def open_database(db_file, cache_size=0):
+    """
+    Opens the Database of a household, raising sqlite3.DatabaseError if it cannot be opened, e.g. if the file is not
+    a SQLite database, instead of returning a Database without connection.
+    """
+    db = Database(db_file, cache_size=cache_size)
+    if db.pool is None:
+        raise sqlite3.DatabaseError(f"cannot open the database {db_file}: {db.open_error}")
+    return db
+
+
+def retrain_model(db_file):
+    """
+    Trains the prediction model of a household again and stores it next to its database.
+    """
+    # sklearn is only needed by the processes that train
+    from MealPlannerInterface import create_dataset, fit_model
+
+    db = open_database(db_file)
+    try:
+        dataset = create_dataset(db)
+        ModelStore(db).save(fit_model(dataset))
+        return {"samples": len(dataset[1])}
+    finally:
+        db.close()
+
+
+def compact_history(db_file, limit=None):
+    """
+    Moves the meal history beyond the retention limit to the archive and gives the free pages back to the disk.
+
+    Parameters:
+    limit (int): new retention limit, None to keep the current one.
+    """
+    db = open_database(db_file)
+    try:
+        before = len(db.get_meal_history())
+        if limit is not None:
+            db.set_meal_history_limit(limit)
+        else:
+            db.trim_meal_history()
+        archived = before - len(db.get_meal_history())
+        # VACUUM cannot run inside a transaction, and rewrites the WAL into the database file
+        db.conn.execute('VACUUM')
+        db.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return {"archived": archived}
+    finally:
+        db.close()
+
+
+def refresh_catalog(db_file, csv_files):
+    """
+    Updates the catalog of a household from CSV files, replacing the rows with the same key.
+
+    Parameters:
+    csv_files (dict): table name -> CSV file, imported in the order of the dictionary, e.g. ingredients first.
+    """
+    db = open_database(db_file)
+    try:
+        return {table: db.load_data_from_csv(csv_file, table, replace=True)["inserted"]
+                for table, csv_file in csv_files.items()}
+    finally:
+        db.close()
+
+
+def _run_on_shard(operation, db_file, kwargs):
+    """
+    Runs an operation on a shard in a worker process, turning its failure into a result.
+    """
+    start = time.perf_counter()
+    try:
+        return {"ok": True, "result": operation(db_file, **kwargs), "error": None,
+                "seconds": time.perf_counter() - start}
+    except Exception:
+        return {"ok": False, "result": None, "error": traceback.format_exc(),
+                "seconds": time.perf_counter() - start}
+
+
+def print_progress(household, done, total, outcome):
+    status = "ok" if outcome["ok"] else "FAILED"
+    print(f"[{done}/{total}] {household}: {status} ({outcome['seconds']:.2f} s)")
+    if not outcome["ok"]:
+        print(outcome["error"])
+
+
+class ShardManager:
+    """
+    Gives access to the households of a deployment, each with its own SQLite file <directory>/<household>.db.
+
+    At most max_open databases are kept open, the least recently used one is closed when another one is opened.
+    Operations on all the households, such as retrain_model, compact_history and refresh_catalog, run on a pool of
+    processes, each opening its own connection to the shards it works on; the failure of a shard does not stop the
+    others.
+    """
+
+    def __init__(self, directory, max_open=16, cache_size=0):
+        self.directory = directory
+        self.max_open = max_open
+        self.cache_size = cache_size
+        self.handles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def path(self, household):
+        return os.path.join(self.directory, household + '.db')
+
+    def households(self):
+        """
+        Returns the names of the households with a database in the directory.
+        """
+        return sorted(os.path.splitext(os.path.basename(path))[0]
+                      for path in glob.glob(os.path.join(glob.escape(self.directory), '*.db')))
+
+    def open(self, household):
+        """
+        Returns the Database of a household, creating it if it does not exist; raises sqlite3.DatabaseError if it
+        cannot be opened.
+        """
+        with self.lock:
+            db = self.handles.get(household)
+            if db is not None:
+                self.handles.move_to_end(household)
+                return db
+
+            db = open_database(self.path(household), self.cache_size)
+            self.handles[household] = db
+            while len(self.handles) > self.max_open:
+                _, evicted = self.handles.popitem(last=False)
+                evicted.close()
+            return db
+
+    def close(self, household=None):
+        """
+        Closes the database of a household, or all the open ones if household is None.
+        """
+        with self.lock:
+            households = list(self.handles) if household is None else [household]
+            for name in households:
+                db = self.handles.pop(name, None)
+                if db is not None:
+                    db.close()
+
+    def run(self, operation, households=None, processes=None, progress=print_progress, **kwargs):
+        """
+        Runs operation(db_file, **kwargs) on many households in parallel.
+
+        The databases of the households are closed first, since their caches would not see the changes made by the
+        other processes. If a worker process dies, the households it had not completed are reported as failed.
+
+        Parameters:
+        operation (function): a function defined at the top level of a module, so that it can be sent to the
+        processes.
+        households (list): names of the households, all of them by default.
+        processes (int): number of processes, the number of CPUs by default.
+        progress (function): called as progress(household, done, total, outcome) when a household is completed.
+
+        Returns:
+        dict: household -> outcome, a dictionary with ok, result, error and seconds.
+        """
+        if households is None:
+            households = self.households()
+        for household in households:
+            self.close(household)
+
+        outcomes = {}
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {executor.submit(_run_on_shard, operation, self.path(household), kwargs): household
+                       for household in households}
+            for future in as_completed(futures):
+                household = futures[future]
+                try:
+                    outcome = future.result()
+                except BrokenProcessPool:
+                    outcome = {"ok": False, "result": None, "error": "the worker process died", "seconds": 0.0}
+                outcomes[household] = outcome
+                if progress is not None:
+                    progress(household, len(outcomes), len(households), outcome)
+        return outcomes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a maintenance operation on all the households of a directory.")
+    parser.add_argument('directory', help="directory with a <household>.db file for each household")
+    parser.add_argument('operation', choices=['retrain', 'compact', 'refresh'])
+    parser.add_argument('--households', nargs='+', help="households to process, all of them by default")
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--limit', type=int, help="new meal history retention limit, for compact")
+    parser.add_argument('--csv', nargs=2, action='append', metavar=('TABLE', 'FILE'), default=[],
+                        help="CSV file of a table, for refresh, can be repeated")
+    args = parser.parse_args()
+
+    shards = ShardManager(args.directory)
+    if args.operation == 'retrain':
+        outcomes = shards.run(retrain_model, args.households, args.processes)
+    elif args.operation == 'compact':
+        outcomes = shards.run(compact_history, args.households, args.processes, limit=args.limit)
+    else:
+        outcomes = shards.run(refresh_catalog, args.households, args.processes, csv_files=dict(args.csv))
+
+    failed = [household for household, outcome in outcomes.items() if not outcome["ok"]]
+    print(f"{len(outcomes) - len(failed)} households completed, {len(failed)} failed")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import csv
+import random
+from datetime import date, timedelta
+
+from Database import Database
+
+INGREDIENT_TYPES = ['beef', 'pork', 'chicken', 'fish', 'vegetables', 'animal origin', 'legumes', 'cerial', 'fruit',
+                    'other']
+RECIPE_TYPES = ['single dish', 'main dish', 'side dish']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MEALS = ['lunch', 'dinner']
+
+
+def generate_rows(ingredients=100, recipes=500, ingredients_per_recipe=8, profiles=4, intolerances_per_profile=2,
+                  history=240, seed=0):
+    """
+    Generates random but reproducible rows for every table of the database.
+
+    Parameters:
+    ingredients (int): number of ingredients.
+    recipes (int): number of recipes.
+    ingredients_per_recipe (int): number of ingredients of each recipe (the recipe_ingredients fan-out).
+    profiles (int): number of profiles.
+    intolerances_per_profile (int): number of intolerances of each profile.
+    history (int): number of meal_history rows.
+    seed (int): seed of the random generator, the same seed always gives the same rows.
+
+    Returns:
+    dict: table name -> list of row tuples, in the column order of the table.
+    """
+    rnd = random.Random(seed)
+
+    ingredient_rows = []
+    for i in range(ingredients):
+        if rnd.random() < 0.5:
+            seasonality_start, seasonality_end = None, None
+        else:
+            seasonality_start, seasonality_end = rnd.randint(1, 12), rnd.randint(1, 12)
+        ingredient_rows.append((f"ingredient_{i}", rnd.choice(INGREDIENT_TYPES), seasonality_start, seasonality_end,
+                                int(rnd.random() < 0.1)))
+
+    recipe_rows = []
+    recipe_ingredient_rows = []
+    fan_out = min(ingredients_per_recipe, ingredients)
+    for recipe_id in range(1, recipes + 1):
+        recipe_rows.append((recipe_id, f"recipe_{recipe_id}", rnd.choice(RECIPE_TYPES), rnd.randint(5, 120),
+                            rnd.randint(1, 8), rnd.randint(1, 5), rnd.randint(0, 1), rnd.randint(-5, 5)))
+        for i in rnd.sample(range(ingredients), fan_out):
+            recipe_ingredient_rows.append((recipe_id, f"ingredient_{i}", rnd.randint(1, 500)))
+
+    profile_rows = []
+    intolerance_rows = []
+    for p in range(profiles):
+        profile_rows.append((f"profile_{p}", int(rnd.random() < 0.2)))
+        for i in rnd.sample(range(ingredients), min(intolerances_per_profile, ingredients)):
+            intolerance_rows.append((f"profile_{p}", f"ingredient_{i}"))
+
+    history_rows = []
+    first_day = date.today() - timedelta(days=max(history // 2, 1))
+    for h in range(history):
+        day = first_day + timedelta(days=h // 2)
+        history_rows.append((h + 1, rnd.randint(1, recipes), day.strftime("%Y-%m-%d"), rnd.randint(0, 1),
+                             rnd.randint(-5, 5), rnd.randint(0, 1)))
+
+    return {
+        'ingredients': ingredient_rows,
+        'recipes': recipe_rows,
+        'recipe_ingredients': recipe_ingredient_rows,
+        'profiles': profile_rows,
+        'profile_intolerances': intolerance_rows,
+        'meal_history': history_rows,
+    }
+
+
+COLUMNS = {
+    'ingredients': ['name', 'type', 'seasonality_start', 'seasonality_end', 'contains_gluten'],
+    'recipes': ['id', 'name', 'type', 'time_to_prepare', 'portions', 'preservation_days', 'can_be_frozen', 'score'],
+    'recipe_ingredients': ['recipe_id', 'ingredient_name', 'quantity'],
+    'profiles': ['name', 'celiac'],
+    'profile_intolerances': ['profile_name', 'ingredient_name'],
+    'meal_history': ['id', 'recipe_id', 'date', 'in_season', 'score', 'accepted'],
+}
+
+
+def generate_database(db_file, seed=0, **counts):
+    """
+    Creates a database filled with synthetic data, with a weekly meal plan whose meals have random participants.
+    The meal history is inserted as it is, the entries beyond the retention limit end up in the archive.
+
+    Parameters:
+    db_file (str): path of the SQLite file to create.
+    seed (int): seed of the random generator.
+    counts: the counts accepted by generate_rows.
+
+    Returns:
+    Database: the filled database.
+    """
+    rows = generate_rows(seed=seed, **counts)
+    db = Database(db_file)
+
+    recipe_ingredients = {}
+    for recipe_id, ingredient_name, quantity in rows['recipe_ingredients']:
+        recipe_ingredients.setdefault(recipe_id, []).append((ingredient_name, quantity))
+    intolerances = {}
+    for profile_name, ingredient_name in rows['profile_intolerances']:
+        intolerances.setdefault(profile_name, []).append(ingredient_name)
+
+    rnd = random.Random(seed)
+    with db.batch():
+        db.add_ingredients(rows['ingredients'])
+        db.add_recipes([(recipe, recipe_ingredients.get(recipe[0], [])) for recipe in rows['recipes']])
+        db.add_profiles([(profile, intolerances.get(profile[0], [])) for profile in rows['profiles']])
+
+        columns = COLUMNS['meal_history']
+        db.conn.executemany(f"INSERT INTO meal_history ({','.join(columns)}) VALUES ({','.join(['?'] * len(columns))})",
+                            rows['meal_history'])
+
+        db.initialize_weekly_meal_plan()
+        profile_names = [profile[0] for profile in rows['profiles']]
+        for day in DAYS:
+            for meal in MEALS:
+                for profile_name in rnd.sample(profile_names, rnd.randint(1, len(profile_names))) if profile_names else []:
+                    db.add_profile_to_meal(day, meal, profile_name)
+
+    return db
+
+
+def write_csv(csv_file, table, rows):
+    """
+    Writes the rows of a table to a CSV file with a header, in the format read by Database.load_data_from_csv.
+    """
+    with open(csv_file, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS[table])
+        writer.writerows(rows)
@@ -0,0 +1,199 @@
+import random
+import time
+
+import numpy as np
+
+from DietaryFilter import DietaryFilter
+from Profiling import profiled
+from RecipeCatalog import RecipeCatalog
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+MEALS = ['lunch', 'dinner']
+
+# Bonus for a meal covered by portions already cooked (fridge, freezer or earlier in the week)
+LEFTOVER_BONUS = 0.5
+# Penalty for cooking again a recipe already cooked during the week
+REPEAT_PENALTY = 1.0
+# Penalty for a meal at work that is not covered by portions cooked before
+WORK_COOKING_PENALTY = 0.5
+
+
+class WeeklyPlanSolver:
+    """
+    Fills all the lunches and dinners of the weekly meal plan without asking anything to the user.
+
+    Each slot can only get main or single dishes that all its participants (from meal_profiles) can eat. The plan
+    maximizes the sum of the probabilities of the chosen recipes, rewarding the use of the portions in the fridge and
+    in the freezer and of the leftovers of the recipes cooked earlier in the week (within their preservation days),
+    and penalizing repeated cooking and cooking for meals at work.
+
+    The search starts from a greedy plan and improves it with local search until no change of a single slot improves
+    it, or until the time budget runs out, whichever comes first. Only the best candidates_per_slot recipes of each
+    slot are considered, so the cost grows linearly with the catalog.
+    """
+
+    def __init__(self, db, prediction_list, catalog=None, time_budget=1.0, candidates_per_slot=50, seed=0):
+        self.db = db
+        self.catalog = catalog if catalog is not None else RecipeCatalog(db)
+        self.dietary_filter = DietaryFilter(db, self.catalog)
+        self.probabilities = {prediction['id']: prediction['probability'] for prediction in prediction_list}
+        self.time_budget = time_budget
+        self.candidates_per_slot = candidates_per_slot
+        self.random = random.Random(seed)
+        self.stock_batches = []
+
+    def _load_slots(self):
+        """
+        Reads the slots of the weekly meal plan, in chronological order, initializing the plan if it is empty.
+
+        Returns:
+        list: a dictionary for each slot with day, meal, participants and location.
+        """
+        weekly_plan = self.db.get_weekly_meal_plan()
+        if len(weekly_plan) == 0:
+            self.db.initialize_weekly_meal_plan()
+            weekly_plan = self.db.get_weekly_meal_plan()
+
+        return sorted(weekly_plan, key=lambda slot: (DAYS.index(slot['day']), MEALS.index(slot['meal'])))
+
+    def _candidates(self, slots):
+        """
+        Selects, for every slot, the most likely main or single dishes that all the participants can eat, plus the
+        allowed ones that are available in the fridge or in the freezer.
+        """
+        catalog = self.catalog.snapshot()
+        allowed_masks = [self.dietary_filter.compile(slot['profiles']) for slot in slots]
+
+        recipe_ids = self.dietary_filter.recipe_ids.tolist()
+        scores = np.array([self.probabilities.get(recipe_id, 0.0) for recipe_id in recipe_ids])
+        is_main = np.array([catalog.types[recipe_id] != 'side dish' for recipe_id in recipe_ids], dtype=bool)
+        position = {recipe_id: index for index, recipe_id in enumerate(recipe_ids)}
+        stored = [position[recipe_id] for recipe_id, portions, expires in self.stock_batches
+                  if portions > 0 and recipe_id in position]
+
+        candidates = []
+        for allowed in allowed_masks:
+            eligible = np.flatnonzero(allowed & is_main)
+            if len(eligible) > self.candidates_per_slot:
+                best = np.argpartition(-scores[eligible], self.candidates_per_slot - 1)
+                eligible = eligible[best[:self.candidates_per_slot]]
+
+            slot_candidates = set(eligible.tolist())
+            slot_candidates |= {index for index in stored if allowed[index] and is_main[index]}
+            candidates.append([recipe_ids[index] for index in sorted(slot_candidates, key=lambda i: -scores[i])])
+
+        return candidates
+
+    def _evaluate(self, slots, plan):
+        """
+        Simulates the week and returns the value of a (possibly partial) plan.
+        """
+        catalog = self.catalog
+        # portions available for each recipe as a list of [last day they can be eaten, portions]
+        available = {}
+        for recipe_id, portions, expires in self.stock_batches:
+            available.setdefault(recipe_id, []).append([expires, portions])
+        cooked = set()
+
+        value = 0.0
+        for index, recipe_id in enumerate(plan):
+            if recipe_id is None:
+                continue
+            slot = slots[index]
+            day = index // len(MEALS)
+            needed = max(len(slot['profiles']), 1)
+            value += self.probabilities.get(recipe_id, 0.0)
+
+            batches = [batch for batch in available.get(recipe_id, []) if batch[0] >= day and batch[1] > 0]
+            if sum(batch[1] for batch in batches) >= needed:
+                value += LEFTOVER_BONUS
+                for batch in batches:
+                    used = min(batch[1], needed)
+                    batch[1] -= used
+                    needed -= used
+                    if needed == 0:
+                        break
+                continue
+
+            if recipe_id in cooked:
+                value -= REPEAT_PENALTY
+            if slot['location'] == 'work':
+                value -= WORK_COOKING_PENALTY
+            cooked.add(recipe_id)
+
+            recipe = catalog.get(recipe_id)
+            leftovers = recipe.portions - needed
+            if leftovers > 0:
+                available.setdefault(recipe_id, []).append([day + recipe.preservation_days, leftovers])
+
+        return value
+
+    @profiled('solve_weekly_plan')
+    def solve(self):
+        """
+        Computes the plan, stopping at the time budget at the latest.
+
+        Returns:
+        list: (day, meal, recipe_id) for every slot, recipe_id is None if no recipe can be served in that slot.
+        """
+        deadline = time.perf_counter() + self.time_budget
+        slots = self._load_slots()
+
+        # fridge portions are assumed to keep for the preservation days of the recipe, freezer portions all week
+        self.stock_batches = []
+        for recipe_id, portions in self.db.get_fridge_contents() or []:
+            recipe = self.catalog.get(recipe_id)
+            if recipe is not None:
+                self.stock_batches.append((recipe_id, portions, recipe.preservation_days))
+        for recipe_id, portions in self.db.get_freezer_contents() or []:
+            self.stock_batches.append((recipe_id, portions, len(DAYS)))
+
+        candidates = self._candidates(slots)
+
+        # greedy seeding: every slot gets the candidate that improves the partial plan the most
+        plan = [None] * len(slots)
+        for index in range(len(slots)):
+            best_value = None
+            for recipe_id in candidates[index]:
+                plan[index] = recipe_id
+                value = self._evaluate(slots, plan[:index + 1])
+                if best_value is None or value > best_value:
+                    best_value = value
+                    best_recipe = recipe_id
+            plan[index] = best_recipe if best_value is not None else None
+
+        # local search: passes over the slots in random order, trying every candidate of each slot and keeping the
+        # changes that improve the plan, until a whole pass improves nothing
+        best_value = self._evaluate(slots, plan)
+        changeable = [index for index in range(len(slots)) if len(candidates[index]) > 1]
+        improved = True
+        while improved and time.perf_counter() < deadline:
+            improved = False
+            self.random.shuffle(changeable)
+            for index in changeable:
+                for recipe_id in candidates[index]:
+                    if recipe_id == plan[index]:
+                        continue
+                    previous = plan[index]
+                    plan[index] = recipe_id
+                    value = self._evaluate(slots, plan)
+                    if value > best_value:
+                        best_value = value
+                        improved = True
+                    else:
+                        plan[index] = previous
+                if time.perf_counter() >= deadline:
+                    break
+
+        return [(slot['day'], slot['meal'], recipe_id) for slot, recipe_id in zip(slots, plan)]
+
+    def plan_week(self):
+        """
+        Computes the plan and saves it in the weekly meal plan with a single transaction.
+
+        Returns:
+        list: (day, meal, recipe_id) for every slot.
+        """
+        plan = self.solve()
+        self.db.add_recipes_to_meals([(recipe_id, day, meal) for day, meal, recipe_id in plan])
+        return plan
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from AsyncDatabase import AsyncDatabase
+from Database import Database
+
+# Takes about 15 seconds, longer than the timeouts of the tests, unless it is interrupted
+SLOW_QUERY = """WITH RECURSIVE counter(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM counter WHERE n < 50000000)
+                SELECT COUNT(*) FROM counter"""
+
+
+class AsyncDatabaseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.directory.name, 'async.db'))
+        self.db.add_ingredient(('salt', 'other', None, None, 0))
+        self.db.add_recipe((1, 'salted water', 'single dish', 5, 1, 1, 0, 0), [('salt', 1)])
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_timed_out_read_on_the_writer_connection_is_interrupted(self):
+        # a read going through the read-write connection, as the point lookups do
+        self.db.get_slow_count = lambda: self.db.conn.execute(SLOW_QUERY).fetchone()
+
+        async def scenario():
+            adb = AsyncDatabase(self.db, max_workers=1)
+            try:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await adb.get_slow_count(timeout=0.2)
+                # the only worker thread is free again as soon as the slow query is interrupted
+                start = time.perf_counter()
+                recipe = await adb.get_recipe_by_id(1, timeout=5)
+                return recipe, time.perf_counter() - start
+            finally:
+                # the connections are closed by tearDown, once the worker is done with them
+                adb.executor.shutdown()
+
+        recipe, elapsed = asyncio.run(scenario())
+        self.assertEqual(recipe.name, 'salted water')
+        self.assertLess(elapsed, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
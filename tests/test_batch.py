@@ -0,0 +1,70 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from Database import Database
+
+INGREDIENT = ('salt', 'other', None, None, 0)
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.directory.name, 'batch.db'))
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_failed_nested_batch_only_rolls_back_its_changes(self):
+        with self.db.batch():
+            self.db.add_ingredient(INGREDIENT)
+            try:
+                with self.db.batch():
+                    self.db.add_to_storage('pepper', 10)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.db.add_to_storage('salt', 5)
+
+        self.assertIsNotNone(self.db.get_ingredient('salt'))
+        self.assertEqual(self.db.get_storage_quantities(), {'salt': 5})
+
+    def test_nested_batch_opened_first_commits_with_the_outer_one(self):
+        try:
+            with self.db.batch():
+                with self.db.batch():
+                    self.db.add_ingredient(INGREDIENT)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertIsNone(self.db.get_ingredient('salt'))
+
+
+class InMemoryBatchTest(unittest.TestCase):
+
+    def test_commit_of_another_thread_does_not_end_the_batch(self):
+        db = Database(':memory:')
+        try:
+            try:
+                with db.batch():
+                    db.add_ingredient(INGREDIENT)
+                    # the other thread shares the connection, its commit must not commit the open batch
+                    thread = threading.Thread(target=db.add_to_storage, args=('pepper', 1))
+                    thread.start()
+                    thread.join()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+            self.assertIsNone(db.get_ingredient('salt'))
+            self.assertEqual(db.batch_depth, 0)
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+from Database import Database
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.directory.name, 'instrumented.db'))
+        self.db.add_ingredient(('salt', 'other', None, None, 0))
+        self.instrumentation = self.db.enable_instrumentation()
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_commit_is_counted_under_the_calling_method(self):
+        self.db.add_to_storage('salt', 5)
+        self.db.add_to_storage('salt', 6)
+
+        stats = self.instrumentation.stats()
+        self.assertNotIn('commit', stats['methods'])
+        self.assertEqual(stats['methods']['add_to_storage']['calls'], 2)
+        # the REPLACE and the COMMIT of each call
+        self.assertEqual(stats['methods']['add_to_storage']['queries'], 4)
+        self.assertEqual(stats['statements']['COMMIT']['methods'], ['add_to_storage'])
+        self.assertEqual(stats['statements']['COMMIT']['calls'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from Database import Database
+from Migrations import MIGRATIONS, get_schema_version
+from Seasonality import ALL_MONTHS, ingredient_season_mask
+
+
+def create_baseline_database(db_file):
+    """
+    Writes a database as the code before the migrations did: no schema version, no season masks, and an ingredient
+    whose seasonality is the blank text stored by menu option 1.
+    """
+    conn = sqlite3.connect(db_file)
+    conn.executescript("""
+        CREATE TABLE ingredients (
+            name text PRIMARY KEY,
+            type text NOT NULL,
+            seasonality_start integer,
+            seasonality_end integer,
+            contains_gluten integer NOT NULL
+        );
+        CREATE TABLE recipes (
+            id integer PRIMARY KEY,
+            name text NOT NULL,
+            type text NOT NULL,
+            time_to_prepare integer NOT NULL,
+            portions integer NOT NULL,
+            preservation_days integer NOT NULL,
+            can_be_frozen integer,
+            score integer NOT NULL DEFAULT 0
+        );
+        CREATE TABLE recipe_ingredients (
+            recipe_id integer,
+            ingredient_name text,
+            quantity integer,
+            PRIMARY KEY(recipe_id, ingredient_name)
+        );
+        INSERT INTO ingredients VALUES ('salt', 'other', '', '', 0);
+        INSERT INTO ingredients VALUES ('pumpkin', 'vegetables', 9, 11, 0);
+        INSERT INTO recipes VALUES (1, 'soup', 'single dish', 30, 2, 3, 1, 0);
+        INSERT INTO recipes VALUES (2, 'salted pumpkin', 'single dish', 30, 2, 3, 1, 0);
+        INSERT INTO recipe_ingredients VALUES (1, 'salt', 5);
+        INSERT INTO recipe_ingredients VALUES (2, 'salt', 5);
+        INSERT INTO recipe_ingredients VALUES (2, 'pumpkin', 500);
+    """)
+    conn.commit()
+    conn.close()
+
+
+class IngredientSeasonMaskTest(unittest.TestCase):
+
+    def test_invalid_months_are_all_year(self):
+        self.assertEqual(ingredient_season_mask('', ''), ALL_MONTHS)
+        self.assertEqual(ingredient_season_mask('march', 5), ALL_MONTHS)
+        self.assertEqual(ingredient_season_mask(0, 13), ALL_MONTHS)
+
+    def test_text_months(self):
+        self.assertEqual(ingredient_season_mask('11', '2'), 0b110000000011)
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.directory.name, 'baseline.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_baseline_database_with_blank_seasonality(self):
+        create_baseline_database(self.db_file)
+
+        db = Database(self.db_file)
+        try:
+            self.assertIsNotNone(db.conn)
+            self.assertEqual(get_schema_version(db), len(MIGRATIONS))
+            self.assertEqual(db.get_season_masks(), {1: ALL_MONTHS, 2: 0b011100000000})
+        finally:
+            db.close()
+
+    def test_add_recipe_with_blank_seasonality(self):
+        db = Database(self.db_file)
+        try:
+            db.add_ingredient(('pepper', 'other', '', '', 0))
+            db.add_recipe((1, 'peppered rice', 'single dish', 20, 2, 2, 0, 0), [('pepper', 1)])
+            self.assertIsNotNone(db.get_recipe_by_id(1))
+            self.assertEqual(db.get_season_masks(), {1: ALL_MONTHS})
+        finally:
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+
+from Database import Database
+from ModelStore import ModelStore
+
+
+class ModelStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.directory.name, 'models.db'))
+        self.store = ModelStore(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def write(self, data):
+        with open(self.store.path, 'wb') as file:
+            file.write(data)
+
+    def test_round_trip(self):
+        self.store.save({'weights': [1, 2]})
+        self.assertEqual(self.store.load(), {'weights': [1, 2]})
+
+    def test_model_of_a_missing_module_is_stale(self):
+        # a pickle referring to a class of a module that is not installed, as after an upgrade of sklearn
+        self.write(b"cno_such_module\nModel\n.")
+        self.assertIsNone(self.store.load())
+
+    def test_model_of_a_missing_class_is_stale(self):
+        # a pickle referring to a class that its module no longer has
+        self.write(b"cos\nNoSuchClass\n.")
+        self.assertIsNone(self.store.load())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from Database import Database
+from Migrations import MIGRATIONS, get_schema_version
+from PantryCoverage import PantryCoverage
+from RecipeCatalog import RecipeCatalog
+
+
+class PantryCoverageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.directory.name, 'pantry.db'))
+        for name in ['salt', 'rice', 'pepper']:
+            self.db.add_ingredient((name, 'other', None, None, 0))
+        self.db.add_recipe((1, 'rice', 'single dish', 20, 2, 2, 0, 0), [('rice', 100), ('salt', 10)])
+        self.db.add_recipe((2, 'peppered rice', 'single dish', 20, 2, 2, 0, 0), [('rice', 100), ('pepper', 100)])
+        self.db.add_to_storage('salt', 50)
+        self.pantry = PantryCoverage(self.db, RecipeCatalog(self.db))
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_only_the_changed_rows_are_read(self):
+        self.assertEqual(self.pantry.coverage().tolist(), [10 / 110, 0.0])
+
+        self.db.add_to_storage('rice', 60)
+        self.assertEqual(self.db.get_storage_changes(self.pantry.storage_version), {'rice': 60})
+        self.assertEqual(self.pantry.coverage().tolist(), [70 / 110, 60 / 200])
+
+        with self.db.batch():
+            self.db.delete_from_storage('salt')
+            self.db.modify_storage_quantity('rice', 500)
+        self.assertEqual(self.db.get_storage_changes(self.pantry.storage_version), {'salt': None, 'rice': 500})
+        self.assertEqual(self.pantry.coverage().tolist(), [100 / 110, 100 / 200])
+
+    def test_changes_of_an_open_batch_are_applied(self):
+        self.pantry.coverage()
+        with self.db.batch():
+            self.db.add_to_storage('pepper', 100)
+            self.assertEqual(self.pantry.coverage().tolist(), [10 / 110, 0.5])
+        self.assertEqual(self.pantry.coverage().tolist(), [10 / 110, 0.5])
+
+
+class StorageChangesMigrationTest(unittest.TestCase):
+
+    def test_rows_stored_before_the_migration_are_recorded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_file = os.path.join(directory, 'pantry.db')
+            db = Database(db_file)
+            db.add_ingredient(('salt', 'other', None, None, 0))
+            db.add_to_storage('salt', 5)
+            # back to the schema before storage_changes
+            db.conn.executescript('DROP TABLE storage_changes;'
+                                  f'PRAGMA user_version = {len(MIGRATIONS) - 1};')
+            db.close()
+
+            db = Database(db_file)
+            try:
+                self.assertEqual(get_schema_version(db), len(MIGRATIONS))
+                self.assertEqual(db.get_storage_changes(-1), {'salt': 5})
+                db.add_to_storage('salt', 7)
+                self.assertEqual(db.get_storage_changes(db.get_storage_version() - 1), {'salt': 7})
+            finally:
+                db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from ShardManager import ShardManager, compact_history
+
+
+class ShardManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.shards = ShardManager(self.directory.name)
+        self.shards.open('good')
+        with open(self.shards.path('broken'), 'wb') as file:
+            file.write(b'this is not a SQLite database' * 100)
+
+    def tearDown(self):
+        self.shards.close()
+        self.directory.cleanup()
+
+    def test_open_invalid_database_raises(self):
+        with self.assertRaises(sqlite3.DatabaseError) as raised:
+            self.shards.open('broken')
+        self.assertIn('cannot open the database', str(raised.exception))
+
+    def test_invalid_shard_fails_alone(self):
+        outcomes = self.shards.run(compact_history, processes=1, progress=None)
+
+        self.assertTrue(outcomes['good']['ok'])
+        self.assertFalse(outcomes['broken']['ok'])
+        self.assertIn('cannot open the database', outcomes['broken']['error'])
+        self.assertNotIn('AttributeError', outcomes['broken']['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()